@@ -0,0 +1,62 @@
+# Script Purpose - Headless batch question answering
+# This script answers a file of questions without the Streamlit UI, e.g. for nightly reports
+# or for pre-computing answers. Questions are read one per line (blank lines and lines starting with '#' are skipped).
+# Answers and their source documents are written as JSON Lines, one object per question, in input order.
+# To execute, run the script manually with `python3 batch_query.py questions.txt --output answers.jsonl`
+
+import argparse
+import json
+import logging
+import sys
+
+from dotenv import load_dotenv
+
+from newsletter_ai import metrics, resources
+from newsletter_ai.rag import rag_query_batch
+
+def read_questions(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a file of questions with NewsLetter.AI.")
+    parser.add_argument('questions', help="Text file with one question per line.")
+    parser.add_argument('--output', default='-', help="JSONL file to write answers to (default: stdout).")
+    parser.add_argument('--model', default=resources.GEMINI_MODEL_NAMES[0], choices=resources.GEMINI_MODEL_NAMES)
+    parser.add_argument('--top-k', type=int, default=10, help="Chunks retrieved per question.")
+    parser.add_argument('--concurrency', type=int, default=4, help="Maximum Gemini calls in flight.")
+    parser.add_argument('--metrics', help="File to write stage timings and counters to, in the Prometheus text format.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+
+    questions = read_questions(args.questions)
+    if not questions:
+        print(f"No questions found in {args.questions}.")
+        return
+
+    corpus = resources.get_corpus(resources.current_files_hash())
+    model = resources.load_models()[args.model]
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        results = rag_query_batch(
+            questions, corpus.index, corpus.chunks, model, args.top_k, args.concurrency,
+            corpus_version=corpus.version, lexical_index=corpus.lexical_index,
+        )
+        for question, response, source_docs, error in results:
+            record = {"question": question, "model": args.model, "corpus_version": corpus.version, "answer": response, "sources": source_docs}
+            if error:
+                record["error"] = error
+            output.write(json.dumps(record) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if args.metrics:
+            with open(args.metrics, 'w') as f:
+                f.write(metrics.render())
+
+if __name__ == "__main__":
+    main()
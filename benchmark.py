@@ -0,0 +1,266 @@
+# Script Purpose - Offline benchmark of the RAG pipeline stages
+# This script measures PDF extraction, chunking, encoding, FAISS index builds, semantic cache lookups
+# and index searches in isolation, on the PDFs in input_files/ and on synthetic corpora scaled up from them.
+# Each stage reports throughput, latency percentiles and peak memory; results are saved as JSON,
+# so regressions can be compared across commits. No network access is needed or attempted.
+# To execute, run the script manually with `python3 benchmark.py`
+# Use `--scales 1,10,100,1000` to choose corpus sizes and `--stages search,cache_lookup` to run only some stages.
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# The encoder must never try to download weights during a benchmark.
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+import numpy as np
+
+from newsletter_ai import ingestion
+
+STAGES = ['extract', 'chunk', 'encode', 'index_build', 'search', 'cache_lookup', 'lexical_search']
+
+# Stages that only depend on the real input files run once, at scale 1.
+UNSCALED_STAGES = {'extract', 'encode'}
+
+# Dimension of all-mpnet-base-v2. The index, cache and search stages use synthetic embeddings of this size,
+# so they can be measured at any scale without running the encoder.
+EMBEDDING_DIMENSION = 768
+
+QUERIES = [
+    "what is the UltraFiber 2.0 service?",
+    "current month's customer satisfaction scores",
+    "who won 'employee of month'?",
+    "Back-to-School Bonanza promotion status",
+    "latest technology news",
+    "any new trainings or learnings planned?",
+]
+
+def percentiles(latencies):
+    latencies = np.asarray(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(latencies, 50)), 3),
+        "p90": round(float(np.percentile(latencies, 90)), 3),
+        "p99": round(float(np.percentile(latencies, 99)), 3),
+        "mean": round(float(latencies.mean()), 3),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def timed(operation, arguments):
+    latencies = []
+    for argument in arguments:
+        started = time.perf_counter()
+        operation(argument)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def synthetic_texts(texts, scale, seed=0):
+    """Return scale variants of every text; each copy shuffles the lines of its source, so copies are not identical."""
+    variants = []
+    for copy in range(scale):
+        shuffler = random.Random(seed + copy)
+        for text in texts:
+            lines = text.split('\n')
+            if copy:
+                shuffler.shuffle(lines)
+            variants.append('\n'.join(lines))
+    return variants
+
+def synthetic_embeddings(num_base, scale, seed=0):
+    """Return num_base * scale unit vectors: copies of num_base clustered centres with a little noise each."""
+    rng = np.random.default_rng(seed)
+    base = rng.standard_normal((num_base, EMBEDDING_DIMENSION)).astype('float32')
+    embeddings = np.repeat(base, scale, axis=0) + 0.1 * rng.standard_normal((num_base * scale, EMBEDDING_DIMENSION)).astype('float32')
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+def query_embeddings(embeddings, count, seed=1):
+    # Half the queries sit next to stored vectors and half are random, so cache lookups see both hits and misses.
+    rng = np.random.default_rng(seed)
+    near = embeddings[rng.integers(0, len(embeddings), count // 2)] + 0.01 * rng.standard_normal((count // 2, EMBEDDING_DIMENSION))
+    far = rng.standard_normal((count - count // 2, EMBEDDING_DIMENSION))
+    queries = np.vstack([near, far]).astype('float32')
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def bench_extract(scale, corpus, options):
+    pdf_paths = [os.path.join(options['input_directory'], filename) for filename in corpus['filenames']]
+    latencies = timed(ingestion.extract_text_from_pdf, pdf_paths * options['repeats'])
+    pages = sum(ingestion.count_pdf_pages(pdf_path) for pdf_path in pdf_paths) * options['repeats']
+    return latencies, {"items": pages, "unit": "pages"}
+
+def bench_chunk(scale, corpus, options):
+    texts = synthetic_texts(corpus['texts'], scale)
+    latencies = timed(ingestion.create_chunks, texts)
+    return latencies, {"items": sum(len(text) for text in texts), "unit": "characters"}
+
+def bench_encode(scale, corpus, options):
+    from newsletter_ai import encoder_backends
+    from newsletter_ai.resources import MODEL_NAME
+    # ENCODER_BACKEND applies here too, so backends can be compared run against run.
+    encoder = encoder_backends.load_encoder(MODEL_NAME, MODEL_NAME)
+    chunks = corpus['chunks']
+    batches = [chunks[start:start + options['batch_size']] for start in range(0, len(chunks), options['batch_size'])]
+    batch_latencies = timed(encoder.encode, batches * options['repeats'])
+    query_latencies = timed(lambda query: encoder.encode([query]), QUERIES * options['repeats'])
+    return batch_latencies, {
+        "items": len(chunks) * options['repeats'],
+        "unit": "chunks",
+        "batch_size": options['batch_size'],
+        "backend": encoder_backends.ENCODER_BACKEND,
+        "query_latency_ms": percentiles(query_latencies),
+    }
+
+def bench_index_build(scale, corpus, options):
+    from newsletter_ai import vector_index
+    embeddings = synthetic_embeddings(len(corpus['chunks']), scale)
+    ids = np.arange(len(embeddings), dtype='int64')
+    latencies = timed(lambda _: vector_index.build_index(embeddings, ids), range(options['repeats']))
+    index_type = vector_index.choose_index_type(len(embeddings), EMBEDDING_DIMENSION)
+    return latencies, {"items": len(embeddings) * options['repeats'], "unit": "vectors", "index_type": index_type}
+
+def bench_search(scale, corpus, options):
+    from newsletter_ai import vector_index
+    embeddings = synthetic_embeddings(len(corpus['chunks']), scale)
+    index = vector_index.build_index(embeddings, np.arange(len(embeddings), dtype='int64'))
+    queries = query_embeddings(embeddings, options['queries'])
+    latencies = timed(lambda query: index.search(query[None, :], options['top_k']), queries)
+    return latencies, {
+        "items": len(queries), "unit": "queries", "vectors": len(embeddings),
+        "index_type": vector_index.index_type_of(index), "top_k": options['top_k'],
+    }
+
+def bench_cache_lookup(scale, corpus, options):
+    from newsletter_ai import semantic_cache
+    embeddings = synthetic_embeddings(len(corpus['chunks']), scale)[:semantic_cache.MAX_ENTRIES]
+    with tempfile.TemporaryDirectory() as directory:
+        cache_file = os.path.join(directory, semantic_cache.CACHE_FILE)
+        # The cache is filled in one transaction, as the app would have after many sessions.
+        connection = semantic_cache.connect(cache_file)
+        connection.execute("BEGIN")
+        connection.executemany(
+            "INSERT INTO semantic_cache (model_name, query, embedding, response, last_used, created_at, documents) "
+            "VALUES ('benchmark', ?, ?, '[]', ?, ?, '{}')",
+            [(f"query {row}", embedding.tobytes(), row, row) for row, embedding in enumerate(embeddings)],
+        )
+        connection.execute("COMMIT")
+        connection.close()
+
+        cache = semantic_cache.SemanticCache('benchmark', cache_file)
+        queries = query_embeddings(embeddings, options['queries'])
+        hits = []
+        latencies = timed(lambda query: hits.append(cache.lookup(query) is not None), queries)
+        cache.connection.close()
+    return latencies, {"items": len(queries), "unit": "lookups", "entries": len(embeddings), "hit_rate": round(float(np.mean(hits)), 3)}
+
+def bench_lexical_search(scale, corpus, options):
+    from newsletter_ai.lexical_index import BM25Index
+    chunks = synthetic_texts(corpus['chunks'], scale)
+    index = BM25Index.build(dict(enumerate(chunks)))
+    queries = (QUERIES * (options['queries'] // len(QUERIES) + 1))[:options['queries']]
+    latencies = timed(lambda query: index.search(query, options['top_k']), queries)
+    return latencies, {"items": len(queries), "unit": "queries", "chunks": len(chunks), "terms": len(index.vocabulary)}
+
+def run_stage(stage, scale, corpus, options):
+    """Run one stage in the current process and return its report."""
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    latencies, details = globals()[f"bench_{stage}"](scale, corpus, options)
+    elapsed = sum(latencies)
+    return {
+        "stage": stage,
+        "scale": scale,
+        **details,
+        "seconds": round(elapsed, 4),
+        "wall_seconds": round(time.perf_counter() - started, 4),
+        "throughput_per_second": round(details["items"] / elapsed, 2) if elapsed else None,
+        "latency_ms": percentiles(latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_rss_before_mb": rss_before,
+    }
+
+def run_isolated(stage, scale, corpus, options):
+    # Every stage runs in a fresh process, so its peak memory is not hidden by whatever an earlier stage allocated.
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        try:
+            return executor.submit(run_stage, stage, scale, corpus, options).result()
+        except Exception as e:
+            return {"stage": stage, "scale": scale, "error": f"{type(e).__name__}: {e}"}
+
+def load_corpus(input_directory):
+    filenames = sorted(filename for filename in os.listdir(input_directory) if filename.endswith('.pdf'))
+    texts = ingestion.extract_texts_from_pdfs([os.path.join(input_directory, filename) for filename in filenames])
+    chunks = [chunk for text in texts for chunk in ingestion.create_chunks(text)]
+    return {"filenames": filenames, "texts": texts, "chunks": chunks}
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark NewsLetter.AI pipeline stages offline.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON report.")
+    parser.add_argument('--input-directory', default=ingestion.PDF_DIRECTORY)
+    parser.add_argument('--scales', default='1,10,100,1000', help="Comma-separated corpus scale factors.")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated stages out of {', '.join(STAGES)}.")
+    parser.add_argument('--repeats', type=int, default=3, help="Repetitions of the extract, chunk, encode and index build stages.")
+    parser.add_argument('--queries', type=int, default=200, help="Queries per search and cache lookup stage.")
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=32, help="Encoder batch size.")
+    args = parser.parse_args()
+
+    stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    scales = [int(scale) for scale in args.scales.split(',')]
+    options = {
+        "input_directory": args.input_directory, "repeats": args.repeats, "queries": args.queries,
+        "top_k": args.top_k, "batch_size": args.batch_size,
+    }
+
+    corpus = load_corpus(args.input_directory)
+    print(f"Base corpus: {len(corpus['filenames'])} PDFs, {len(corpus['chunks'])} chunks.")
+
+    results = []
+    for stage in stages:
+        for scale in ([1] if stage in UNSCALED_STAGES else scales):
+            result = run_isolated(stage, scale, corpus, options)
+            results.append(result)
+            if "error" in result:
+                print(f"{stage} x{scale}: skipped ({result['error']})")
+            else:
+                latency = result['latency_ms']
+                print(
+                    f"{stage} x{scale}: {result['throughput_per_second']} {result['unit']}/s, "
+                    f"p50 {latency['p50']}ms, p99 {latency['p99']}ms, peak RSS {result['peak_rss_mb']}MB"
+                )
+
+    report = {
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "base_chunks": len(corpus['chunks']),
+        "options": options,
+        "results": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()
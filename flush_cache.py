@@ -4,7 +4,9 @@
 # To execute, run the script manually with `python3 flush_caches.py`
 
 import streamlit as st
+import glob
 import os
+import shutil
 
 def flush_cache():
     # Clear Streamlit cache
@@ -15,7 +17,10 @@ def flush_cache():
 def delete_files(file_paths):
     for file_path in file_paths:
         try:
-            os.remove(file_path)
+            if os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+            else:
+                os.remove(file_path)
             print(f"File '{file_path}' has been deleted successfully.")
         except FileNotFoundError:
             print(f"File '{file_path}' not found.")
@@ -30,7 +35,20 @@ def main():
     # Files to be deleted
     files_to_delete = [
         './semantic_cache.json',
+        './semantic_cache.db',
+        './semantic_cache.db-wal',
+        './semantic_cache.db-shm',
         './faiss_index.pkl',
+        './corpus_manifest.json',
+        './file_fingerprints.json',
+        './encoder_reference.npz',
+        './embedding_cache.db',
+        './embedding_cache.db-wal',
+        './embedding_cache.db-shm',
+        *glob.glob('./faiss_index_*.index'),
+        *glob.glob('./lexical_index_*.npz'),
+        *glob.glob('./chunk_store_*'),
+        './index_bundles',
     ]
 
     if choice == 'flush':
@@ -0,0 +1,56 @@
+# Script Purpose - Offline ingestion into a versioned index bundle
+# This script ingests the PDFs once, ahead of deployment, and writes an immutable bundle with the chunk store,
+# embeddings, FAISS and BM25 indexes, manifest and sentence transformer weights to index_bundles/<version>/.
+# The app opens it read-only at startup when INDEX_BUNDLE points at it (the dockerfile runs this at image build time),
+# so instances start without parsing PDFs, encoding chunks or downloading the encoder.
+# To execute, run the script manually with `python3 ingest.py --output index_bundles`
+
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from newsletter_ai import bundle, encoder_backends, ingestion, resources
+from newsletter_ai.embedding_store import EmbeddingStore
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return number
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a NewsLetter.AI index bundle from the input PDFs.")
+    parser.add_argument('--input', default=ingestion.PDF_DIRECTORY, help="Directory with the newsletter PDFs.")
+    parser.add_argument('--output', default=bundle.BUNDLE_DIRECTORY, help="Directory to write bundles to.")
+    parser.add_argument('--keep', type=positive_int, default=bundle.KEEP_BUNDLES, help="Bundles to keep, including the new one.")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    if bundle.BUNDLE_PATH:
+        parser.error("INDEX_BUNDLE is set; unset it so the bundle is built from the input files and the downloaded encoder.")
+
+    file_hashes = ingestion.get_file_hashes(args.input)
+    files_hash = ingestion.get_files_hash(args.input, file_hashes)
+    # The local manifest and embedding cache are reused, so a rebuild only processes new or changed newsletters.
+    manifest = ingestion.update_manifest(args.input, ingestion.MANIFEST_FILE, file_hashes)
+    name = bundle.bundle_name(ingestion.corpus_version(manifest))
+    path = os.path.join(args.output, name)
+
+    os.makedirs(args.output, exist_ok=True)
+    if os.path.isdir(path):
+        print(f"Bundle {path} is already up to date.")
+    else:
+        # The bundle ships the full-precision weights; the app may still serve them on an optimized backend.
+        # The chunk embeddings come from the same reference model, through the local embedding cache.
+        encoder = encoder_backends.load_torch(resources.MODEL_NAME)
+        embedding_store = EmbeddingStore(resources.MODEL_NAME, encoder.encode)
+        metadata = bundle.build_bundle(path, manifest, files_hash, encoder, embedding_store.encode, resources.MODEL_NAME)
+        print(f"Built bundle {path}: {metadata['chunks']} chunks, {metadata['index_type']} index.")
+    bundle.set_current(args.output, name)
+    bundle.remove_old_bundles(args.output, name, args.keep)
+
+if __name__ == "__main__":
+    main()
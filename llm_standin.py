@@ -0,0 +1,143 @@
+# Script Purpose - Local stand-in for the Gemini API
+# This script serves a fake text generation endpoint, so the whole pipeline can be load-tested and benchmarked
+# without GCP credentials or network access. Point the app at it with LLM_BACKEND=standin
+# (and LLM_STANDIN_URL if it is not on the default port).
+# Latency, streaming speed and errors are configurable, so retries, timeouts and throughput can be exercised.
+# To execute, run the script manually with `python3 llm_standin.py --latency 0.5 --error-rate 0.05`
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUESTION_PATTERN = re.compile(r"Question:\s*(.*?)\s*Answer:\s*$", re.S)
+
+def count_tokens(text):
+    # About four characters per token, as in the context packer.
+    return max(1, len(text) // 4)
+
+def make_answer(model, prompt, words):
+    """Return a deterministic answer of the given number of words that quotes the question."""
+    match = QUESTION_PATTERN.search(prompt)
+    question = match.group(1) if match else prompt[-80:]
+    opening = f"This is a stand-in answer from {model} to: {question}."
+    filler = "The newsletters cover sales, networks, operations and IT updates for this month".split()
+    return ' '.join([opening] + [filler[i % len(filler)] for i in range(max(words - len(opening.split()), 0))])
+
+class StandinHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1, so clients can keep connections open and reuse them across calls.
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        if self.path != '/generate':
+            self.send_json(404, {"error": "not found"})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        options = self.server.options
+        self.server.count_request()
+
+        delay = max(options.latency + random.uniform(-options.jitter, options.jitter), 0)
+        time.sleep(delay)
+        if random.random() < options.error_rate:
+            self.send_json(options.error_status, {"error": "injected error"})
+            return
+
+        prompt = request.get("prompt", "")
+        max_words = request.get("settings", {}).get("max_output_tokens", options.words)
+        text = make_answer(request.get("model", "stand-in"), prompt, min(options.words, max_words))
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(text)}
+        if not request.get("stream"):
+            time.sleep(options.piece_latency * len(text.split()) / options.words_per_piece)
+            self.send_json(200, {"text": text, "usage": usage})
+        else:
+            self.stream_pieces(text, usage)
+
+    def stream_pieces(self, text, usage):
+        options = self.server.options
+        words = text.split(' ')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        pieces = [' '.join(words[i:i + options.words_per_piece]) for i in range(0, len(words), options.words_per_piece)]
+        for position, piece in enumerate(pieces):
+            if position:
+                time.sleep(options.piece_latency)
+                piece = ' ' + piece
+            if position and random.random() < options.stream_error_rate:
+                # A failure after text was sent: the client must not retry and repeat it.
+                self.write_chunk({"error": "injected stream error", "code": 500})
+                break
+            self.write_chunk({"text": piece})
+        else:
+            self.write_chunk({"usage": usage})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        line = json.dumps(data).encode('utf-8') + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode('ascii') + line + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # One line per request would dominate a load test; the server logs a request rate instead.
+        pass
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options):
+        super().__init__(address, StandinHandler)
+        self.options = options
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+def report(server, interval=10):
+    seen = 0
+    while True:
+        time.sleep(interval)
+        with server.lock:
+            total = server.requests
+        logging.info(f"{(total - seen) / interval:.1f} requests/s, {total} in total.")
+        seen = total
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the Gemini API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.2, help="Seconds before the first piece (or the whole answer).")
+    parser.add_argument('--jitter', type=float, default=0.05, help="Uniform +/- jitter on --latency, in seconds.")
+    parser.add_argument('--piece-latency', type=float, default=0.02, help="Seconds between streamed pieces.")
+    parser.add_argument('--words', type=int, default=60, help="Words per answer.")
+    parser.add_argument('--words-per-piece', type=int, default=4, help="Words per streamed piece.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with --error-status.")
+    parser.add_argument('--error-status', type=int, default=429, help="HTTP status of injected errors, e.g. 429 or 503.")
+    parser.add_argument('--stream-error-rate', type=float, default=0.0, help="Chance of failing after each streamed piece.")
+    options = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = StandinServer((options.host, options.port), options)
+    threading.Thread(target=report, args=(server,), daemon=True).start()
+    logging.info(f"Stand-in LLM serving on http://{options.host}:{options.port}/generate")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
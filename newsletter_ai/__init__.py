@@ -0,0 +1,3 @@
+# Core retrieval pipeline for NewsLetter.AI.
+# I have kept everything that is not Streamlit UI in this package so that the chatbot page,
+# command line tools and worker processes can all import the same building blocks.
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+from newsletter_ai import ingestion
+
+# I have packaged everything a query needs into one immutable, versioned directory, built offline by ingest.py:
+# the chunk store, the chunk embeddings, the FAISS and BM25 indexes, the corpus manifest and the encoder weights
+# (with reference embeddings to check optimized encoder backends against).
+# With INDEX_BUNDLE set, the app opens it read-only at startup: no PDF is parsed, no chunk is encoded,
+# nothing is downloaded from the Hugging Face hub, and every replica serves exactly the same index version.
+# INDEX_BUNDLE may name a bundle directory or the directory ingest.py writes bundles to (its CURRENT file is followed).
+BUNDLE_PATH = os.environ.get("INDEX_BUNDLE", "")
+BUNDLE_DIRECTORY = 'index_bundles'
+KEEP_BUNDLES = 3
+
+# Bumped whenever the layout of a bundle changes; bundles of another format are refused rather than misread.
+BUNDLE_FORMAT = 1
+METADATA_FILE = 'bundle.json'
+CURRENT_FILE = 'CURRENT'
+
+CHUNK_STORE = 'chunk_store'
+EMBEDDINGS_FILE = 'embeddings.npy'
+FAISS_INDEX_FILE = 'faiss.index'
+LEXICAL_INDEX_FILE = 'lexical_index.npz'
+MANIFEST_FILE = 'manifest.json'
+ENCODER_DIRECTORY = 'encoder'
+ENCODER_REFERENCE_FILE = 'encoder_reference.npz'
+
+def resolve(path):
+    """Return the bundle directory for path, following the CURRENT file of a bundle output directory."""
+    current_file = os.path.join(path, CURRENT_FILE)
+    if os.path.exists(current_file):
+        with open(current_file, 'r') as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+class Bundle:
+    """A read-only index bundle on disk."""
+
+    def __init__(self, path, metadata):
+        self.path = path
+        self.metadata = metadata
+
+    @classmethod
+    def open(cls, path, model_name):
+        path = resolve(path)
+        with open(os.path.join(path, METADATA_FILE), 'r') as f:
+            metadata = json.load(f)
+        if metadata.get('format') != BUNDLE_FORMAT:
+            raise ValueError(f"Index bundle {path} has format {metadata.get('format')}; this version reads format {BUNDLE_FORMAT}.")
+        if metadata['model_name'] != model_name:
+            raise ValueError(f"Index bundle {path} was built with {metadata['model_name']}, not {model_name}.")
+        logging.info(f"Using index bundle {path} (corpus version {metadata['version']}, {metadata['chunks']} chunks).")
+        return cls(path, metadata)
+
+    @property
+    def version(self):
+        return self.metadata['version']
+
+    @property
+    def files_hash(self):
+        return self.metadata['files_hash']
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def load_corpus(self):
+        """Open the bundle's chunk store and indexes memory-mapped and read-only."""
+        from newsletter_ai import vector_index
+        from newsletter_ai.chunk_store import ChunkStore
+        from newsletter_ai.corpus import Corpus
+        from newsletter_ai.lexical_index import BM25Index
+        index_file = self.file(FAISS_INDEX_FILE)
+        return Corpus(
+            self.files_hash,
+            self.version,
+            ChunkStore.load(self.file(CHUNK_STORE)),
+            vector_index.load_index_mmap(index_file),
+            BM25Index.load(self.file(LEXICAL_INDEX_FILE)),
+            self.metadata['document_hashes'],
+            index_file,
+        )
+
+def bundle_name(version):
+    # Index build settings are part of the name, like the saved FAISS indexes, so a settings change makes a new bundle.
+    from newsletter_ai.vector_index import index_settings_key
+    return f"{version}_{index_settings_key()}"
+
+def make_read_only(path):
+    for root, _, files in os.walk(path):
+        for name in files:
+            os.chmod(os.path.join(root, name), 0o444)
+
+def build_bundle(path, manifest, files_hash, encoder, encode, model_name):
+    """Write a bundle for manifest to path. encoder is saved with the bundle; encode(texts) returns embeddings.
+
+    encoder must be the full-precision reference model: its weights and probe embeddings are what
+    optimized encoder backends are checked against.
+    """
+    from newsletter_ai import encoder_backends, vector_index
+    from newsletter_ai.chunk_store import ChunkStore
+    from newsletter_ai.lexical_index import BM25Index
+
+    # I have written into a temporary directory and renamed it, so a bundle is either complete or absent.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    ChunkStore.build(manifest).save(os.path.join(tmp_path, CHUNK_STORE))
+    chunks = ChunkStore.load(os.path.join(tmp_path, CHUNK_STORE))
+    chunk_ids = np.asarray(chunks.chunk_ids, dtype='int64')
+    # Embeddings are kept row-aligned with the chunk store, so other index types can be built without the encoder.
+    embeddings = np.asarray(encode([chunks[chunk_id] for chunk_id in chunk_ids.tolist()]), dtype='float32')
+    np.save(os.path.join(tmp_path, EMBEDDINGS_FILE), embeddings)
+    index = vector_index.build_index(embeddings, chunk_ids)
+    vector_index.save_index(index, os.path.join(tmp_path, FAISS_INDEX_FILE))
+    BM25Index.build(chunks).save(os.path.join(tmp_path, LEXICAL_INDEX_FILE))
+    ingestion.save_manifest(manifest, os.path.join(tmp_path, MANIFEST_FILE))
+    encoder.save(os.path.join(tmp_path, ENCODER_DIRECTORY))
+    encoder_backends.save_reference(
+        os.path.join(tmp_path, ENCODER_REFERENCE_FILE), model_name,
+        np.asarray(encoder.encode(encoder_backends.PROBE_SENTENCES), dtype='float32'),
+    )
+
+    metadata = {
+        "format": BUNDLE_FORMAT,
+        "version": ingestion.corpus_version(manifest),
+        "files_hash": files_hash,
+        "document_hashes": {filename: entry['hash'] for filename, entry in manifest['documents'].items()},
+        "model_name": model_name,
+        "chunks": len(chunks),
+        "dimension": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "index_type": vector_index.index_type_of(index),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+    with open(os.path.join(tmp_path, METADATA_FILE), 'w') as f:
+        json.dump(metadata, f, indent=2)
+    make_read_only(tmp_path)
+    os.rename(tmp_path, path)
+    return metadata
+
+def set_current(bundle_directory, name):
+    tmp_file = os.path.join(bundle_directory, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_file, 'w') as f:
+        f.write(name + '\n')
+    os.replace(tmp_file, os.path.join(bundle_directory, CURRENT_FILE))
+
+def remove_old_bundles(bundle_directory, current, keep=KEEP_BUNDLES):
+    paths = [
+        entry.path for entry in os.scandir(bundle_directory)
+        if entry.is_dir() and entry.name != current and not entry.name.endswith('.tmp')
+    ]
+    # The current bundle is always kept, whatever keep says.
+    for path in sorted(paths, key=os.path.getmtime, reverse=True)[max(keep, 1) - 1:]:
+        # The files are read-only, which only protects them from writes; the directory can still be removed.
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,148 @@
+import glob
+import json
+import logging
+import os
+import shutil
+from collections.abc import Mapping
+
+import numpy as np
+
+# I have kept the chunk texts of each corpus version in one contiguous UTF-8 blob with an offsets array,
+# plus parallel arrays for the document, page and byte range of every chunk, saved as .npy files under
+# chunk_store_<corpus version>/. They are opened memory-mapped, so all workers share one copy through the page cache
+# and a search result maps to its text and citation by array lookup, without a Python object per chunk.
+STORE_DIRECTORY = '.'
+STORE_PREFIX = 'chunk_store_'
+KEEP_STORE_VERSIONS = 2
+
+ARRAYS = ('blob', 'offsets', 'chunk_ids', 'doc_ids', 'pages', 'byte_starts', 'byte_ends')
+DOCUMENTS_FILE = 'documents.json'
+
+class ChunkStore(Mapping):
+    """Read-only mapping of chunk id to chunk text, with the source document and location of every chunk.
+
+    Chunk ids are the manifest's ids and are sorted, so a lookup is a binary search. Page and byte range
+    are -1 for chunks whose location is unknown, e.g. chunks ingested before locations were recorded.
+    """
+
+    def __init__(self, blob, offsets, chunk_ids, doc_ids, pages, byte_starts, byte_ends, documents):
+        self.blob = blob
+        # The text of the chunk at position p is blob[offsets[p]:offsets[p + 1]].
+        self.offsets = offsets
+        self.chunk_ids = chunk_ids
+        self.doc_ids = doc_ids
+        self.pages = pages
+        # Byte range of the chunk within its document's extracted text.
+        self.byte_starts = byte_starts
+        self.byte_ends = byte_ends
+        self.documents = documents
+
+    def _position(self, chunk_id):
+        position = int(np.searchsorted(self.chunk_ids, chunk_id))
+        if position == len(self.chunk_ids) or self.chunk_ids[position] != chunk_id:
+            raise KeyError(chunk_id)
+        return position
+
+    def __getitem__(self, chunk_id):
+        position = self._position(chunk_id)
+        return bytes(self.blob[self.offsets[position]:self.offsets[position + 1]]).decode('utf-8')
+
+    def __contains__(self, chunk_id):
+        try:
+            self._position(chunk_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.chunk_ids.tolist())
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def document(self, chunk_id):
+        return self.documents[self.doc_ids[self._position(chunk_id)]]
+
+    def citation(self, chunk_id):
+        position = self._position(chunk_id)
+        return {
+            "document": self.documents[self.doc_ids[position]],
+            "page": int(self.pages[position]),
+            "byte_start": int(self.byte_starts[position]),
+            "byte_end": int(self.byte_ends[position]),
+        }
+
+    @classmethod
+    def build(cls, manifest):
+        """Build a store from a manifest's chunks and document entries."""
+        documents = sorted(manifest['documents'])
+        located = {}
+        for doc_id, filename in enumerate(documents):
+            entry = manifest['documents'][filename]
+            pages = entry.get('chunk_pages') or [-1] * len(entry['chunk_ids'])
+            spans = entry.get('chunk_spans') or [[-1, -1]] * len(entry['chunk_ids'])
+            for chunk_id, page, (byte_start, byte_end) in zip(entry['chunk_ids'], pages, spans):
+                located[chunk_id] = (doc_id, page, byte_start, byte_end)
+
+        chunk_ids = np.asarray(sorted(manifest['chunks']), dtype='int64')
+        encoded = [manifest['chunks'][chunk_id].encode('utf-8') for chunk_id in chunk_ids.tolist()]
+        offsets = np.zeros(len(encoded) + 1, dtype='int64')
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+        locations = np.asarray([located.get(chunk_id, (-1, -1, -1, -1)) for chunk_id in chunk_ids.tolist()], dtype='int64').reshape(-1, 4)
+        return cls(
+            np.frombuffer(b''.join(encoded), dtype='uint8'),
+            offsets,
+            chunk_ids,
+            locations[:, 0].astype('int32'),
+            locations[:, 1].astype('int32'),
+            locations[:, 2],
+            locations[:, 3],
+            documents,
+        )
+
+    def save(self, store_directory):
+        # I have written into a temporary directory and renamed it, so readers never see a half-written store.
+        tmp_directory = f"{store_directory}.{os.getpid()}.tmp"
+        os.makedirs(tmp_directory, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_directory, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(tmp_directory, DOCUMENTS_FILE), 'w') as f:
+            json.dump(self.documents, f)
+        try:
+            os.rename(tmp_directory, store_directory)
+        except OSError:
+            # Another process saved the same version first; its store is identical.
+            shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    @classmethod
+    def load(cls, store_directory):
+        arrays = {}
+        for name in ARRAYS:
+            path = os.path.join(store_directory, f"{name}.npy")
+            try:
+                arrays[name] = np.load(path, mmap_mode='r')
+            except ValueError:
+                # An empty array cannot be memory-mapped.
+                arrays[name] = np.load(path)
+        with open(os.path.join(store_directory, DOCUMENTS_FILE), 'r') as f:
+            documents = json.load(f)
+        return cls(documents=documents, **arrays)
+
+def store_path(version, store_directory=STORE_DIRECTORY):
+    return os.path.join(store_directory, f"{STORE_PREFIX}{version}")
+
+def remove_old_stores(store_directory=STORE_DIRECTORY, keep=KEEP_STORE_VERSIONS):
+    # Processes that still have an old version mapped keep reading it; its files are only unlinked.
+    paths = [path for path in glob.glob(os.path.join(store_directory, f"{STORE_PREFIX}*")) if not path.endswith('.tmp')]
+    for path in sorted(paths, key=os.path.getmtime, reverse=True)[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def load_or_build_store(manifest, version, store_directory=STORE_DIRECTORY):
+    """Return the memory-mapped chunk store for this corpus version, building it from the manifest if needed."""
+    path = store_path(version, store_directory)
+    if not os.path.isdir(path):
+        store = ChunkStore.build(manifest)
+        store.save(path)
+        remove_old_stores(store_directory)
+        logging.info(f"Built chunk store: {len(store)} chunks, {len(store.blob)} bytes of text.")
+    return ChunkStore.load(path)
@@ -0,0 +1,93 @@
+import math
+import os
+
+# I have packed the retrieved chunks into the prompt instead of concatenating them verbatim.
+# create_chunks overlaps neighbouring chunks by 200 characters, so chunks retrieved from the same part of a newsletter
+# repeat text. The packer merges overlapping or adjacent chunks of one document into a single passage using their
+# byte ranges from the chunk store, drops text that is already in the context, and stops at a token budget.
+# Chunks are taken in relevance order, so the budget always goes to the best matches first.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 2500))
+
+# Gemini's tokenizer is not available offline; about four characters per token is close for English text.
+CHARS_PER_TOKEN = float(os.environ.get("CONTEXT_CHARS_PER_TOKEN", 4))
+
+# Chunks separated by no more than a line break count as adjacent and are joined into one passage.
+MERGE_GAP_BYTES = 2
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+class Passage:
+    """A contiguous span of one document, built from one or more chunks."""
+
+    def __init__(self, document, start, end, data, rank, chunk_ids):
+        self.document = document
+        # Byte range within the document's extracted text; -1 when the chunk's location is unknown.
+        self.start = start
+        self.end = end
+        self.data = data
+        self.rank = rank
+        self.chunk_ids = chunk_ids
+
+    @property
+    def text(self):
+        return self.data.decode('utf-8')
+
+    def touches(self, other):
+        return (
+            self.start >= 0 and other.start >= 0 and self.document == other.document
+            and self.start <= other.end + MERGE_GAP_BYTES and other.start <= self.end + MERGE_GAP_BYTES
+        )
+
+def merge(passages):
+    """Merge passages of one document that overlap or touch, in document order."""
+    passages = sorted(passages, key=lambda passage: passage.start)
+    merged = passages[0]
+    for passage in passages[1:]:
+        if passage.end <= merged.end:
+            data = merged.data
+        elif passage.start <= merged.end:
+            # Only the part of the later passage past the end of the merged one is new text.
+            data = merged.data + passage.data[merged.end - passage.start:]
+        else:
+            data = merged.data + b"\n" + passage.data
+        merged = Passage(
+            merged.document, merged.start, max(merged.end, passage.end), data,
+            min(merged.rank, passage.rank), merged.chunk_ids + passage.chunk_ids,
+        )
+    return merged
+
+def pack_context(chunk_ids, chunks, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Return (passages, used_chunk_ids): deduplicated context passages in relevance order within token_budget.
+
+    chunk_ids are ranked best first; chunks is the ChunkStore they come from.
+    """
+    passages = []
+    used_tokens = 0
+    for rank, chunk_id in enumerate(chunk_ids):
+        if chunk_id not in chunks:
+            continue
+        text = chunks[chunk_id]
+        citation = chunks.citation(chunk_id)
+        candidate = Passage(
+            citation["document"], citation["byte_start"], citation["byte_end"], text.encode('utf-8'), rank, [chunk_id],
+        )
+        neighbours = [passage for passage in passages if passage.touches(candidate)]
+        if neighbours:
+            candidate = merge(neighbours + [candidate])
+        elif any(text in passage.text for passage in passages):
+            # The same text already sits in the context, e.g. a paragraph repeated in two newsletters.
+            continue
+
+        added_tokens = estimate_tokens(candidate.text) - sum(estimate_tokens(passage.text) for passage in neighbours)
+        if added_tokens <= 0 and neighbours:
+            # The chunk lies entirely inside text already in the context.
+            continue
+        if used_tokens + added_tokens > token_budget:
+            continue
+        passages = [passage for passage in passages if passage not in neighbours] + [candidate]
+        used_tokens += added_tokens
+
+    passages.sort(key=lambda passage: passage.rank)
+    used_chunk_ids = [chunk_id for passage in passages for chunk_id in passage.chunk_ids]
+    return [passage.text for passage in passages], used_chunk_ids
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+
+# I have served every query from one immutable corpus snapshot: the chunk store, FAISS index and BM25 index
+# of a single corpus version. When the input files change, the next version is built by a background worker,
+# next to the current one (every file is named after its version), and then swapped in with a single assignment.
+# A query holds on to the snapshot it started with, so in-flight and new queries keep being answered
+# from the previous version until the swap, and nobody waits for re-extraction or re-embedding.
+
+class Corpus:
+    """One version of the searchable corpus."""
+
+    def __init__(self, files_hash, version, chunks, index, lexical_index, document_hashes, index_file):
+        # Hash of the input files this snapshot was built for; compared against the files on every query.
+        self.files_hash = files_hash
+        self.version = version
+        self.chunks = chunks
+        self.index = index
+        self.lexical_index = lexical_index
+        self.document_hashes = document_hashes
+        self.index_file = index_file
+
+    @property
+    def chunk_id_limit(self):
+        # Chunk ids are handed out in increasing order, so every chunk added later gets an id at or above this.
+        return int(self.chunks.chunk_ids[-1]) + 1 if len(self.chunks) else 0
+
+class CorpusManager:
+    """Holds the corpus being served and rebuilds it in the background when the input files change.
+
+    build(files_hash) returns a new Corpus; activate(corpus) is called just before it is swapped in.
+    """
+
+    def __init__(self, build, activate=None):
+        self.build = build
+        self.activate = activate or (lambda corpus: None)
+        self.current = None
+        self.lock = threading.Lock()
+        # Builds write the shared manifest and saved files, so only one runs at a time.
+        self.build_lock = threading.Lock()
+        self.pending_hash = None
+        self.worker = None
+        self.listeners = []
+
+    def get(self, files_hash):
+        """Return the corpus to answer a query with, scheduling a rebuild if files_hash is newer than it."""
+        corpus = self.current
+        if corpus is None:
+            # Nothing to serve yet, so the very first version is built in the foreground.
+            with self.build_lock:
+                if self.current is None:
+                    self._swap(self.build(files_hash))
+            return self.current
+        if corpus.files_hash != files_hash:
+            self.rebuild(files_hash)
+        return corpus
+
+    def subscribe(self, listener):
+        """Call listener(corpus) after every swap, and straight away for the corpus already being served."""
+        with self.lock:
+            self.listeners.append(listener)
+            corpus = self.current
+        if corpus is not None:
+            listener(corpus)
+
+    def rebuild(self, files_hash):
+        """Build the corpus for files_hash in the background; repeated calls for one hash start one build."""
+        with self.lock:
+            self.pending_hash = files_hash
+            if self.worker is not None:
+                # The running worker picks the newest hash up when its current build finishes.
+                return
+            self.worker = threading.Thread(target=self._run, name="newsletter-ai-corpus-rebuild", daemon=True)
+            self.worker.start()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                files_hash = self.pending_hash
+                if files_hash is None or (self.current is not None and self.current.files_hash == files_hash):
+                    self.pending_hash = None
+                    self.worker = None
+                    return
+            started = time.perf_counter()
+            try:
+                with self.build_lock:
+                    corpus = self.build(files_hash)
+                    self._swap(corpus)
+            except Exception:
+                # The previous version keeps serving; the next query that sees the change tries again.
+                logging.exception("Background corpus rebuild failed.")
+                with self.lock:
+                    if self.pending_hash == files_hash:
+                        self.pending_hash = None
+                    self.worker = None
+                return
+            logging.info(f"Swapped in corpus version {corpus.version} after a {time.perf_counter() - started:.2f}s background rebuild.")
+
+    def _swap(self, corpus):
+        self.activate(corpus)
+        self.current = corpus
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(corpus)
+            except Exception:
+                # A listener only adds work on top of the swap; its failure must not undo it.
+                logging.exception("Corpus listener failed.")
@@ -0,0 +1,62 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+# I have precomputed the answers to the curated questions offered in the chatbot's dropdown.
+# After every corpus swap a background warm-up encodes them, runs retrieval and asks each Gemini model once,
+# filling the retrieval and answer caches for that corpus version. Answers cached under an earlier version are
+# generated again and replaced, since a question like "latest technology news" changes with every newsletter.
+# Picking one of these questions is then answered from the caches without an encoder call, a search or a Gemini call.
+# WARM_UP_ANSWERS=false turns it off.
+WARM_UP_ANSWERS = os.environ.get("WARM_UP_ANSWERS", "true").lower() == "true"
+
+CURATED_QUESTIONS = [
+    "what is the UltraFiber 2.0 service?",
+    "current month's customer satisfaction scores",
+    "who won 'employee of month'?",
+    "Back-to-School Bonanza promotion status",
+    "latest technology news",
+    "any new trainings or learnings planned?",
+]
+
+# Query embeddings of the curated questions. They depend only on the encoder, which is fixed for the process.
+EMBEDDINGS = {}
+embeddings_lock = threading.Lock()
+
+def precompute_embeddings(encoder):
+    with embeddings_lock:
+        if not EMBEDDINGS:
+            vectors = np.asarray(encoder.encode(CURATED_QUESTIONS), dtype='float32')
+            EMBEDDINGS.update(zip(CURATED_QUESTIONS, vectors))
+
+def precompute(corpus, models, is_current):
+    """Fill the caches with the curated questions' retrieval results and answers for corpus and every model.
+
+    is_current() tells whether corpus is still the one being served; the warm-up stops once it is not.
+    """
+    from newsletter_ai import resources
+    from newsletter_ai.rag import rag_query_batch
+
+    started = time.perf_counter()
+    precompute_embeddings(resources.get_encoder())
+    query_vectors = np.stack([EMBEDDINGS[question] for question in CURATED_QUESTIONS])
+    for model_name, model in models.items():
+        if not is_current():
+            logging.info(f"Corpus version {corpus.version} was replaced; stopping the answer warm-up.")
+            return
+        # Answers already cached for this version, e.g. by another worker process on this host, are not generated again.
+        results = rag_query_batch(
+            CURATED_QUESTIONS, corpus.index, corpus.chunks, model,
+            corpus_version=corpus.version, lexical_index=corpus.lexical_index,
+            query_vectors=query_vectors, reuse_older_answers=False,
+        )
+        failed = [question for question, _, _, error in results if error]
+        if failed:
+            logging.warning(f"Answer warm-up for {model_name}: {len(failed)} question(s) failed and will be answered on demand.")
+    logging.info(
+        f"Answer warm-up for corpus version {corpus.version} finished in {time.perf_counter() - started:.2f}s: "
+        f"{len(CURATED_QUESTIONS)} questions, {len(models)} models."
+    )
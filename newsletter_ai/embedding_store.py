@@ -0,0 +1,70 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+from newsletter_ai import metrics
+
+# I have stored chunk embeddings by (model name, hash of the chunk text).
+# Most chunks are byte-identical between builds, so only genuinely new text has to go through the encoder.
+STORE_FILE = 'embedding_cache.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model_name TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    PRIMARY KEY (model_name, text_hash)
+) WITHOUT ROWID
+"""
+
+# SQLite limits the number of bound parameters per statement, so lookups are done in batches.
+LOOKUP_BATCH_SIZE = 500
+
+def text_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class EmbeddingStore:
+    """Content-addressed cache in front of a sentence encoder."""
+
+    def __init__(self, model_name, encode, store_file=STORE_FILE):
+        self.model_name = model_name
+        self.encode_uncached = encode
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(store_file, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+
+    def lookup(self, hashes):
+        found = {}
+        for start in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+            batch = hashes[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows = self.connection.execute(
+                f"SELECT text_hash, embedding FROM embeddings WHERE model_name = ? AND text_hash IN ({placeholders})",
+                (self.model_name, *batch),
+            )
+            found.update((row_hash, np.frombuffer(embedding, dtype='float32')) for row_hash, embedding in rows)
+        return found
+
+    def encode(self, texts):
+        """Return float32 embeddings for texts, encoding only those not seen before."""
+        hashes = [text_hash(text) for text in texts]
+        with self.lock:
+            found = self.lookup(list(set(hashes)))
+            missing = {chunk_hash: text for chunk_hash, text in zip(hashes, texts) if chunk_hash not in found}
+            metrics.inc('cache_requests_total', len(found), cache='embeddings', result='hit')
+            metrics.inc('cache_requests_total', len(missing), cache='embeddings', result='miss')
+            if missing:
+                logging.info(f"Encoding {len(missing)} new chunk(s); {len(texts) - len(missing)} served from the embedding cache.")
+                embeddings = np.asarray(self.encode_uncached(list(missing.values())), dtype='float32')
+                self.connection.execute("BEGIN")
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model_name, text_hash, embedding) VALUES (?, ?, ?)",
+                    [(self.model_name, missing_hash, embedding.tobytes()) for missing_hash, embedding in zip(missing, embeddings)],
+                )
+                self.connection.execute("COMMIT")
+                found.update(zip(missing, embeddings))
+        return np.stack([found[chunk_hash] for chunk_hash in hashes]) if hashes else np.zeros((0, 0), dtype='float32')
@@ -0,0 +1,93 @@
+import logging
+import os
+
+import numpy as np
+
+# I have made the inference backend of the sentence transformer configurable, since every query and cache miss
+# runs it on CPU. ENCODER_BACKEND selects:
+# - torch (default): the full-precision PyTorch model,
+# - int8: the PyTorch model with its Linear layers dynamically quantized to int8 (no extra dependencies),
+# - onnx: ONNX Runtime through sentence-transformers' onnx backend (needs optimum[onnxruntime]);
+#   ENCODER_ONNX_FILE picks a prepared variant such as onnx/model_qint8_avx512_vnni.onnx.
+# An optimized encoder is only used if its embeddings of a fixed set of probe sentences stay within ENCODER_MIN_COSINE
+# of the reference model's, so the saved indexes and cached query embeddings stay valid; otherwise torch is used.
+ENCODER_BACKEND = os.environ.get("ENCODER_BACKEND", "torch").lower()
+ENCODER_ONNX_FILE = os.environ.get("ENCODER_ONNX_FILE", "")
+ENCODER_MIN_COSINE = float(os.environ.get("ENCODER_MIN_COSINE", 0.99))
+
+ENCODER_BACKENDS = ('torch', 'int8', 'onnx')
+
+# The reference model's probe embeddings are computed once and saved, so later checks do not load the reference model.
+REFERENCE_FILE = 'encoder_reference.npz'
+
+PROBE_SENTENCES = [
+    "what is the UltraFiber 2.0 service?",
+    "current month's customer satisfaction scores",
+    "who won 'employee of month'?",
+    "Back-to-School Bonanza promotion status",
+    "Our 5G network expansion played a crucial role in the success of the SmartCity Solutions project.",
+    "Implementation of advanced traffic management algorithms to ensure ultra-low latency.",
+    "Remember to take regular breaks and practice stress-reducing techniques, such as deep breathing or meditation.",
+    "Q3 revenue grew 12% while churn fell to 1.1%, the lowest in the company's history.",
+]
+
+def load_torch(name_or_path):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name_or_path)
+
+def load_optimized(name_or_path, backend):
+    if backend == 'int8':
+        import torch
+        model = load_torch(name_or_path)
+        # Dynamic quantization stores the Linear weights as int8 and quantizes activations on the fly.
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == 'onnx':
+        from sentence_transformers import SentenceTransformer
+        model_kwargs = {"file_name": ENCODER_ONNX_FILE} if ENCODER_ONNX_FILE else None
+        return SentenceTransformer(name_or_path, backend='onnx', model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown ENCODER_BACKEND {backend!r}; expected one of {', '.join(ENCODER_BACKENDS)}.")
+
+def save_reference(reference_file, model_name, embeddings):
+    tmp_file = f"{reference_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        np.savez(f, model_name=model_name, sentences=np.asarray(PROBE_SENTENCES), embeddings=embeddings)
+    os.replace(tmp_file, reference_file)
+
+def reference_embeddings(name_or_path, model_name, reference_file=REFERENCE_FILE):
+    """Return the reference model's embeddings of PROBE_SENTENCES, computing and saving them on first use."""
+    try:
+        with np.load(reference_file) as data:
+            if str(data['model_name']) == model_name and data['sentences'].tolist() == PROBE_SENTENCES:
+                return data['embeddings']
+    except FileNotFoundError:
+        pass
+    logging.info("Computing reference embeddings for the encoder check with the full-precision model.")
+    embeddings = np.asarray(load_torch(name_or_path).encode(PROBE_SENTENCES), dtype='float32')
+    save_reference(reference_file, model_name, embeddings)
+    return embeddings
+
+def min_cosine(embeddings, reference):
+    embeddings = np.asarray(embeddings, dtype='float32')
+    dots = np.sum(embeddings * reference, axis=1)
+    norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1)
+    return float(np.min(dots / np.maximum(norms, 1e-12)))
+
+def load_encoder(name_or_path, model_name, backend=ENCODER_BACKEND, reference_file=REFERENCE_FILE):
+    """Return a sentence encoder for name_or_path on the configured backend, or on torch if that is not close enough."""
+    if backend == 'torch':
+        return load_torch(name_or_path)
+    try:
+        encoder = load_optimized(name_or_path, backend)
+    except (ImportError, TypeError) as e:
+        # TypeError: sentence-transformers before 3.2 has no backend argument.
+        logging.warning(f"Encoder backend {backend} is not available ({e}); using torch.")
+        return load_torch(name_or_path)
+
+    similarity = min_cosine(encoder.encode(PROBE_SENTENCES), reference_embeddings(name_or_path, model_name, reference_file))
+    if similarity < ENCODER_MIN_COSINE:
+        logging.warning(
+            f"Encoder backend {backend} drifts from the reference model (min cosine {similarity:.4f} < {ENCODER_MIN_COSINE}); using torch."
+        )
+        return load_torch(name_or_path)
+    logging.info(f"Using the {backend} encoder backend (min cosine to the reference model {similarity:.4f}).")
+    return encoder
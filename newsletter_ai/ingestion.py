@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+PDF_DIRECTORY = './input_files/'
+
+# I have kept a per-document manifest next to the FAISS index.
+# It records the content hash and chunk ids of every ingested PDF, so only new or changed files are re-processed.
+MANIFEST_FILE = 'corpus_manifest.json'
+
+# I have cached a (size, mtime, inode) fingerprint with every file's content hash, so detecting changes is a stat() per
+# file and only files whose stat changed are read and hashed again. The cache is saved next to the manifest,
+# so a restart does not re-read the archive either.
+FINGERPRINT_FILE = 'file_fingerprints.json'
+# A file modified within this many seconds of being hashed could change again within the same mtime tick,
+# so its fingerprint is not trusted and it is hashed again next time.
+RACY_MTIME_SECONDS = 2.0
+
+# I have parsed PDFs in a process pool, since pypdf is pure Python and a single core is the bottleneck on a cold start.
+# Large PDFs are split into page ranges so that one long newsletter does not keep a single worker busy.
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", os.cpu_count() or 1))
+PAGES_PER_TASK = int(os.environ.get("INGEST_PAGES_PER_TASK", 16))
+
+def extract_pages_from_pdf(pdf_path, start_page=0, end_page=None):
+    # I have returned one string per page and left joining to the caller, which avoids quadratic string building.
+    # pypdf is only imported here, so pages that import this module for the file hashes do not load it.
+    from pypdf import PdfReader
+    with open(pdf_path, 'rb') as file:
+        reader = PdfReader(file)
+        return [page.extract_text() for page in reader.pages[start_page:end_page]]
+
+def extract_text_from_pdf(pdf_path):
+    # I have extracted text from PDFs to make the content searchable.
+    # This allows me to work with various document formats in a unified way.
+    return join_pages(extract_pages_from_pdf(pdf_path))
+
+def count_pdf_pages(pdf_path):
+    from pypdf import PdfReader
+    with open(pdf_path, 'rb') as file:
+        return len(PdfReader(file).pages)
+
+def join_pages(pages):
+    return ''.join(f"{page_text}\n" for page_text in pages)
+
+def extract_pages_from_pdfs(pdf_paths, max_workers=INGEST_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """Extract the pages of many PDFs concurrently, returning one list of page texts per PDF in the order of pdf_paths."""
+    tasks = []
+    for position, pdf_path in enumerate(pdf_paths):
+        num_pages = count_pdf_pages(pdf_path)
+        for start_page in range(0, max(num_pages, 1), pages_per_task):
+            tasks.append((position, pdf_path, start_page, start_page + pages_per_task))
+
+    pages = [[] for _ in pdf_paths]
+    if max_workers <= 1 or len(tasks) <= 1:
+        for position, pdf_path, start_page, end_page in tasks:
+            pages[position].extend(extract_pages_from_pdf(pdf_path, start_page, end_page))
+    else:
+        # I have used the spawn start method, because forking a process that already runs Streamlit
+        # threads and PyTorch can deadlock the child.
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)), mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [executor.submit(extract_pages_from_pdf, pdf_path, start_page, end_page) for _, pdf_path, start_page, end_page in tasks]
+            # Tasks were queued in document and page order, so collecting them in order keeps pages in sequence.
+            for (position, *_), future in zip(tasks, futures):
+                pages[position].extend(future.result())
+
+    return pages
+
+def extract_texts_from_pdfs(pdf_paths, max_workers=INGEST_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """Extract the text of many PDFs concurrently, returning it in the same order as pdf_paths."""
+    return [join_pages(document_pages) for document_pages in extract_pages_from_pdfs(pdf_paths, max_workers, pages_per_task)]
+
+def create_chunks(text, chunk_size=1000, chunk_overlap=200):
+    # I have chunked the text for two main reasons:
+    # 1. It allows me to process long documents that might exceed model token limits.
+    # 2. It creates more granular pieces of text, improving retrieval accuracy.
+    # I have used overlap to maintain context between chunks.
+    # LangChain is imported here so that PDF extraction workers do not pay for importing it.
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+    chunks = text_splitter.split_text(text)
+    return chunks
+
+def chunk_locations(pages, chunks):
+    """Return the page number (from 1) and UTF-8 byte range within the joined page text of every chunk.
+
+    Chunks are located in order, each after the start of the previous one; a chunk that cannot be found gets -1.
+    """
+    text = join_pages(pages)
+    page_starts = np.cumsum([0] + [len(page_text) + 1 for page_text in pages])
+    chunk_pages, chunk_spans = [], []
+    search_from = char_position = byte_position = 0
+    for chunk in chunks:
+        start = text.find(chunk, search_from)
+        if start == -1:
+            chunk_pages.append(-1)
+            chunk_spans.append([-1, -1])
+            continue
+        # Byte offsets are accumulated incrementally, so non-ASCII text costs one pass over the document.
+        byte_position += len(text[char_position:start].encode('utf-8'))
+        char_position = start
+        chunk_pages.append(int(np.searchsorted(page_starts, start, side='right')))
+        chunk_spans.append([byte_position, byte_position + len(chunk.encode('utf-8'))])
+        search_from = start + 1
+    return chunk_pages, chunk_spans
+
+def get_file_hash(file_path):
+    # I have hashed every file on its own so a single new newsletter does not invalidate the others.
+    hash_md5 = hashlib.md5()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(4096), b""):
+            hash_md5.update(chunk)
+    return hash_md5.hexdigest()
+
+class FingerprintCache:
+    """Content hashes of files, reused for as long as the file's size, mtime and inode are unchanged."""
+
+    def __init__(self, fingerprint_file=FINGERPRINT_FILE):
+        self.fingerprint_file = fingerprint_file
+        self.lock = threading.Lock()
+        self.entries = None
+
+    def _load(self):
+        try:
+            with open(self.fingerprint_file, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_file = f"{self.fingerprint_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_file, self.fingerprint_file)
+
+    def file_hashes(self, directory):
+        """Return a mapping of PDF file name to content hash, hashing only files whose stat changed."""
+        with self.lock:
+            if self.entries is None:
+                self.entries = self._load()
+            hashes = {}
+            changed = False
+            for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+                if not entry.name.endswith('.pdf'):
+                    continue
+                stat = entry.stat()
+                path = os.path.abspath(entry.path)
+                fingerprint = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+                cached = self.entries.get(path)
+                if cached and cached[:3] == fingerprint:
+                    hashes[entry.name] = cached[3]
+                    continue
+                file_hash = get_file_hash(entry.path)
+                hashes[entry.name] = file_hash
+                if time.time() - stat.st_mtime_ns / 1e9 >= RACY_MTIME_SECONDS:
+                    self.entries[path] = fingerprint + [file_hash]
+                    changed = True
+            # Removed files are forgotten, so the cache only ever covers the files of the directories in use.
+            directory_path = os.path.abspath(directory)
+            for path in [path for path in self.entries if os.path.dirname(path) == directory_path and os.path.basename(path) not in hashes]:
+                del self.entries[path]
+                changed = True
+            if changed:
+                self._save()
+            return hashes
+
+FINGERPRINTS = FingerprintCache()
+
+def get_file_hashes(directory):
+    """Return a mapping of PDF file name to content hash for the given directory."""
+    return FINGERPRINTS.file_hashes(directory)
+
+def get_files_hash(directory, file_hashes=None):
+    # I have hashed the input files to detect changes.
+    # This is useful for maintaining an up-to-date knowledge base without unnecessary reprocessing.
+    # The corpus hash is derived from the per-file hashes, so renames and deletions also change it.
+    if file_hashes is None:
+        file_hashes = get_file_hashes(directory)
+    hash_md5 = hashlib.md5()
+    for filename, file_hash in sorted(file_hashes.items()):
+        hash_md5.update(f"{filename}:{file_hash}\n".encode('utf-8'))
+    return hash_md5.hexdigest()
+
+def empty_manifest():
+    return {"documents": {}, "chunks": {}, "next_chunk_id": 0}
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    # JSON only has string keys, so I have converted the chunk ids back to integers after loading.
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return empty_manifest()
+    manifest['chunks'] = {int(chunk_id): text for chunk_id, text in manifest['chunks'].items()}
+    return manifest
+
+def save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    # I have written to a temporary file and renamed it, so a crash never leaves a half-written manifest behind.
+    tmp_file = f"{manifest_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, manifest_file)
+
+def update_manifest(directory=PDF_DIRECTORY, manifest_file=MANIFEST_FILE, file_hashes=None):
+    """Bring the manifest in line with the PDFs on disk, extracting only added or changed documents."""
+    manifest = load_manifest(manifest_file)
+    if file_hashes is None:
+        file_hashes = get_file_hashes(directory)
+    documents = manifest['documents']
+
+    # I have dropped documents that were removed or replaced, together with their chunks.
+    # Their chunk ids are never reused, so the matching vectors can be deleted from the index by id.
+    stale = [filename for filename, entry in documents.items() if file_hashes.get(filename) != entry['hash']]
+    for filename in stale:
+        for chunk_id in documents.pop(filename)['chunk_ids']:
+            manifest['chunks'].pop(chunk_id, None)
+
+    added = [filename for filename in file_hashes if filename not in documents]
+    pages = extract_pages_from_pdfs([os.path.join(directory, filename) for filename in added])
+    for filename, document_pages in zip(added, pages):
+        chunks = create_chunks(join_pages(document_pages))
+        first_id = manifest['next_chunk_id']
+        chunk_ids = list(range(first_id, first_id + len(chunks)))
+        manifest['next_chunk_id'] = first_id + len(chunks)
+        manifest['chunks'].update(zip(chunk_ids, chunks))
+        # The page and byte range of every chunk are recorded for citations.
+        chunk_pages, chunk_spans = chunk_locations(document_pages, chunks)
+        documents[filename] = {
+            "hash": file_hashes[filename], "chunk_ids": chunk_ids, "chunk_pages": chunk_pages, "chunk_spans": chunk_spans,
+        }
+
+    if stale or added:
+        logging.info(f"Manifest updated: {len(added)} document(s) extracted, {len(stale)} removed or replaced.")
+        save_manifest(manifest, manifest_file)
+    return manifest
+
+def corpus_version(manifest):
+    # I have versioned the corpus by its documents and their chunk ids rather than by file contents alone.
+    # A document that is removed and later re-added gets fresh chunk ids, so it must not match an older index.
+    documents = json.dumps(manifest['documents'], sort_keys=True)
+    return hashlib.md5(documents.encode('utf-8')).hexdigest()
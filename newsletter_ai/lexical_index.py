@@ -0,0 +1,173 @@
+import glob
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import NamedTuple
+
+import numpy as np
+
+# I have added a BM25 inverted index next to the FAISS index. It is built when the corpus is loaded and saved
+# per corpus version, e.g. lexical_index_<corpus version>.npz, so later processes load it instead of re-tokenizing.
+# Exact terms such as product names ("UltraFiber 2.0") are matched precisely, where the embedding model tends to blur them.
+INDEX_DIRECTORY = '.'
+INDEX_PREFIX = 'lexical_index_'
+INDEX_SUFFIX = '.npz'
+KEEP_INDEX_VERSIONS = 2
+
+# Standard BM25 parameters: k1 saturates term frequency, b normalizes by chunk length.
+BM25_K1 = float(os.environ.get("BM25_K1", 1.5))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+
+# I have fused the lexical and dense rankings with reciprocal rank fusion, which needs no score calibration.
+HYBRID_RETRIEVAL = os.environ.get("HYBRID_RETRIEVAL", "true").lower() == "true"
+RRF_K = int(os.environ.get("RRF_K", 60))
+
+# With LEXICAL_SKIP_DENSE on, a query whose best lexical match covers at least LEXICAL_CONFIDENCE of the query's
+# term weight is answered from BM25 alone: the sentence transformer is not run, and the embedding-keyed caches are bypassed.
+LEXICAL_SKIP_DENSE = os.environ.get("LEXICAL_SKIP_DENSE", "false").lower() == "true"
+LEXICAL_CONFIDENCE = float(os.environ.get("LEXICAL_CONFIDENCE", 0.8))
+
+STOP_WORDS = frozenset(
+    "a an and any are as at be by for from has have how i in is it its me my of on or our that the their this "
+    "to was we were what when where which who whom why will with you your".split()
+)
+
+TOKEN_PATTERN = re.compile(r"\w+(?:\.\d+)*")
+
+def tokenize(text):
+    # Version numbers such as "2.0" are kept as one token, so "UltraFiber 2.0" does not match every "0" in the corpus.
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+def contains(sorted_positions, position):
+    i = np.searchsorted(sorted_positions, position)
+    return i < len(sorted_positions) and sorted_positions[i] == position
+
+class LexicalHits(NamedTuple):
+    chunk_ids: list
+    scores: list
+    # Share of the query's term weight (IDF) found in the best chunk, from 0 to 1.
+    confidence: float
+
+class BM25Index:
+    """BM25 inverted index over corpus chunks, stored as compressed sparse postings in flat numpy arrays."""
+
+    def __init__(self, terms, offsets, postings, frequencies, lengths, chunk_ids):
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms.tolist())}
+        self.terms = terms
+        # The postings of term t are postings[offsets[t]:offsets[t + 1]], positions into chunk_ids in ascending order.
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.chunk_ids = chunk_ids
+        num_chunks = len(chunk_ids)
+        self.average_length = float(lengths.mean()) if num_chunks else 0.0
+        document_frequencies = np.diff(offsets)
+        self.idf = np.log1p((num_chunks - document_frequencies + 0.5) / (document_frequencies + 0.5))
+        # A query term that appears nowhere is as informative as the rarest term could be.
+        self.unknown_idf = math.log1p((num_chunks + 0.5) / 0.5)
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    @classmethod
+    def build(cls, all_chunks):
+        vocabulary = {}
+        term_ids, positions, frequencies = [], [], []
+        lengths = np.zeros(len(all_chunks), dtype='float32')
+        for position, text in enumerate(all_chunks.values()):
+            counts = Counter(tokenize(text))
+            lengths[position] = sum(counts.values())
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                positions.append(position)
+                frequencies.append(count)
+
+        term_ids = np.asarray(term_ids, dtype='int64')
+        # A stable sort by term keeps each term's postings in chunk order, which lets search use searchsorted.
+        order = np.argsort(term_ids, kind='stable')
+        offsets = np.zeros(len(vocabulary) + 1, dtype='int64')
+        offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+        return cls(
+            np.asarray(list(vocabulary), dtype=str),
+            offsets,
+            np.asarray(positions, dtype='int32')[order],
+            np.asarray(frequencies, dtype='float32')[order],
+            lengths,
+            np.fromiter(all_chunks.keys(), dtype='int64', count=len(all_chunks)),
+        )
+
+    def search(self, query, top_k=10):
+        """Return the top_k chunk ids by BM25 score for query, with the lexical confidence of the best match."""
+        scores = np.zeros(len(self.chunk_ids), dtype='float32')
+        matched = []
+        total_weight = 0.0
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                total_weight += self.unknown_idf
+                continue
+            idf = self.idf[term_id]
+            total_weight += idf
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            positions = self.postings[start:end]
+            frequencies = self.frequencies[start:end]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[positions] / self.average_length)
+            scores[positions] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norm)
+            matched.append((idf, positions))
+
+        if not matched:
+            return LexicalHits([], [], 0.0)
+        top_k = min(top_k, int(np.count_nonzero(scores)))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+
+        best_weight = sum(idf for idf, positions in matched if contains(positions, top[0]))
+        return LexicalHits(self.chunk_ids[top].tolist(), scores[top].tolist(), float(best_weight / total_weight))
+
+    def save(self, index_file):
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            np.savez(
+                f, terms=self.terms, offsets=self.offsets, postings=self.postings,
+                frequencies=self.frequencies, lengths=self.lengths, chunk_ids=self.chunk_ids,
+            )
+        os.replace(tmp_file, index_file)
+
+    @classmethod
+    def load(cls, index_file):
+        with np.load(index_file) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+def fuse(dense_ids, lexical_ids, top_k, k=RRF_K):
+    """Reciprocal rank fusion of two ranked id lists: each list contributes 1 / (k + rank)."""
+    scores = {}
+    for ranking in (dense_ids, lexical_ids):
+        for rank, chunk_id in enumerate(ranking):
+            if chunk_id != -1:
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:top_k]
+
+def index_path(version, index_directory=INDEX_DIRECTORY):
+    return os.path.join(index_directory, f"{INDEX_PREFIX}{version}{INDEX_SUFFIX}")
+
+def remove_old_indexes(index_directory=INDEX_DIRECTORY, keep=KEEP_INDEX_VERSIONS):
+    paths = sorted(glob.glob(os.path.join(index_directory, f"{INDEX_PREFIX}*{INDEX_SUFFIX}")), key=os.path.getmtime, reverse=True)
+    for index_file in paths[keep:]:
+        try:
+            os.remove(index_file)
+        except FileNotFoundError:
+            pass
+
+def load_or_build_index(all_chunks, version, index_directory=INDEX_DIRECTORY):
+    """Return the BM25 index for this corpus version, building and saving it if needed."""
+    index_file = index_path(version, index_directory)
+    if os.path.exists(index_file):
+        return BM25Index.load(index_file)
+    index = BM25Index.build(all_chunks)
+    index.save(index_file)
+    remove_old_indexes(index_directory)
+    logging.info(f"Built BM25 index: {len(index.vocabulary)} terms over {len(index)} chunks.")
+    return index
@@ -0,0 +1,208 @@
+import abc
+import http.client
+import json
+import os
+import queue
+from urllib.parse import urlsplit
+
+from newsletter_ai import metrics
+
+# I have put the text generation models behind a small backend interface, so the RAG pipeline does not depend on the
+# Vertex AI SDK. LLM_BACKEND selects the implementation:
+# - vertex (default): Gemini on Vertex AI,
+# - standin: the local stand-in server in llm_standin.py, for load tests and benchmarks without GCP credentials.
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "vertex").lower()
+STANDIN_URL = os.environ.get("LLM_STANDIN_URL", "http://127.0.0.1:8765")
+# Idle keep-alive connections kept per stand-in model; calls beyond this open a connection and close it afterwards.
+STANDIN_POOL_SIZE = int(os.environ.get("LLM_STANDIN_POOL_SIZE", 32))
+STANDIN_TIMEOUT_SECONDS = float(os.environ.get("LLM_STANDIN_TIMEOUT_SECONDS", 60.0))
+
+class LLMBackend(abc.ABC):
+    """A named text generation model.
+
+    generate() returns the whole answer; stream() returns an iterator over its text pieces.
+    Both are blocking and are run on the LLM client's worker threads. Errors carry the HTTP status
+    in .code where there is one, so the client can tell throttling from bad requests.
+    """
+
+    # Prefix of the key that identifies this backend's models in cache scopes, semaphores and metrics.
+    key_prefix = ''
+
+    def __init__(self, name):
+        self.name = name
+        # Answers from the stand-in must never be served as Gemini answers, so the backend is part of the key.
+        self.key = f"{self.key_prefix}{name}"
+
+    @abc.abstractmethod
+    def generate(self, prompt, settings):
+        """Return the whole answer text for prompt."""
+
+    @abc.abstractmethod
+    def stream(self, prompt, settings):
+        """Return an iterator over the answer's text pieces."""
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name!r})"
+
+class VertexBackend(LLMBackend):
+    """Gemini on Vertex AI. vertexai.init() must have been called."""
+
+    def __init__(self, name):
+        from vertexai.generative_models import GenerativeModel
+        super().__init__(name)
+        self.model = GenerativeModel(name)
+
+    def _generate_content(self, prompt, settings, stream):
+        from vertexai.generative_models import GenerationConfig, HarmBlockThreshold, HarmCategory
+
+        # Here I have defined safety settings to handle harmful content.
+        # https://cloud.google.com/vertex-ai/generative-ai/docs/model-reference/inference#request
+        safety_settings = {
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_ONLY_HIGH,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_ONLY_HIGH,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_ONLY_HIGH,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_ONLY_HIGH,
+        }
+        return self.model.generate_content(
+            prompt,
+            generation_config=GenerationConfig(**settings),
+            safety_settings=safety_settings,
+            stream=stream,
+        )
+
+    def record_usage(self, usage_metadata):
+        # Vertex AI reports usage on the response, and on the last piece of a streamed response.
+        if usage_metadata is not None:
+            metrics.record_token_usage(
+                self.key,
+                getattr(usage_metadata, 'prompt_token_count', 0) or 0,
+                getattr(usage_metadata, 'candidates_token_count', 0) or 0,
+            )
+
+    def generate(self, prompt, settings):
+        response = self._generate_content(prompt, settings, stream=False)
+        self.record_usage(getattr(response, 'usage_metadata', None))
+        return response.text
+
+    def stream(self, prompt, settings):
+        return self._stream_text(self._generate_content(prompt, settings, stream=True))
+
+    def _stream_text(self, responses):
+        usage_metadata = None
+        for r in responses:
+            usage_metadata = getattr(r, 'usage_metadata', None) or usage_metadata
+            try:
+                yield r.text
+            except IndexError:
+                # Chunks without candidates carry no text.
+                continue
+        self.record_usage(usage_metadata)
+
+class StandinError(Exception):
+    """An error status returned by the stand-in server."""
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one host, reused across calls and threads."""
+
+    def __init__(self, url, size=STANDIN_POOL_SIZE, timeout=STANDIN_TIMEOUT_SECONDS):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def get(self):
+        """Return (connection, reused)."""
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout), False
+
+    def put(self, connection):
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+class StandinBackend(LLMBackend):
+    """Client for the local stand-in server (llm_standin.py), with pooled keep-alive connections."""
+
+    key_prefix = 'standin/'
+
+    def __init__(self, name, url=STANDIN_URL, pool=None):
+        super().__init__(name)
+        self.pool = pool or ConnectionPool(url)
+
+    def _post(self, body):
+        payload = json.dumps(body).encode('utf-8')
+        while True:
+            connection, reused = self.pool.get()
+            try:
+                connection.request('POST', '/generate', payload, {'Content-Type': 'application/json'})
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    # The server closed an idle connection; only a fresh connection failing is a real error.
+                    continue
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.status != 200:
+                message = response.read().decode('utf-8', 'replace')
+                self.pool.put(connection)
+                raise StandinError(response.status, message)
+            return connection, response
+
+    def generate(self, prompt, settings):
+        connection, response = self._post({"model": self.name, "prompt": prompt, "settings": settings, "stream": False})
+        try:
+            result = json.loads(response.read())
+        except BaseException:
+            connection.close()
+            raise
+        self.pool.put(connection)
+        metrics.record_token_usage(self.key, result["usage"]["prompt_tokens"], result["usage"]["completion_tokens"])
+        return result["text"]
+
+    def stream(self, prompt, settings):
+        connection, response = self._post({"model": self.name, "prompt": prompt, "settings": settings, "stream": True})
+        return self._stream_text(connection, response)
+
+    def _stream_text(self, connection, response):
+        # The server sends one JSON object per line; the last one carries the usage instead of text.
+        finished = False
+        try:
+            for line in response:
+                piece = json.loads(line)
+                if "usage" in piece:
+                    metrics.record_token_usage(self.key, piece["usage"]["prompt_tokens"], piece["usage"]["completion_tokens"])
+                    continue
+                if "error" in piece:
+                    raise StandinError(piece.get("code", 500), piece["error"])
+                yield piece["text"]
+            finished = True
+        finally:
+            # A connection is only reusable once its response has been read to the end.
+            if finished:
+                self.pool.put(connection)
+            else:
+                connection.close()
+
+def load_backends(model_names, backend=LLM_BACKEND):
+    """Return {model name: LLMBackend} for the configured backend."""
+    if backend == 'vertex':
+        import vertexai
+        # I have initialized Vertex AI with credentials from environment variables, enabling access to Google Cloud resources.
+        vertexai.init(project=os.environ.get("GCP_PROJECT"), location=os.environ.get("GCP_REGION"))
+        return {name: VertexBackend(name) for name in model_names}
+    if backend == 'standin':
+        # One pool for all models: they share the same server.
+        pool = ConnectionPool(STANDIN_URL)
+        return {name: StandinBackend(name, pool=pool) for name in model_names}
+    raise ValueError(f"Unknown LLM_BACKEND {backend!r}; expected 'vertex' or 'standin'.")
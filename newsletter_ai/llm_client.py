@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from newsletter_ai import metrics
+
+# I have wrapped every Gemini call in an asyncio client with:
+# - exponential backoff with full jitter, so throttled sessions do not retry in lockstep,
+# - retries only for throttling (429) and server errors (5xx), never for bad requests,
+# - a concurrency limit per model, shared by every session in the process,
+# - a deadline that covers queueing, every attempt and every backoff sleep.
+MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", 8))
+# LLM_MAX_RETRIES counts attempts, the first one included; anything below 1 still makes one attempt.
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))
+BACKOFF_BASE_SECONDS = float(os.environ.get("LLM_BACKOFF_BASE_SECONDS", 1.0))
+BACKOFF_MAX_SECONDS = float(os.environ.get("LLM_BACKOFF_MAX_SECONDS", 30.0))
+TIMEOUT_SECONDS = float(os.environ.get("LLM_TIMEOUT_SECONDS", 120.0))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRYABLE_GRPC_CODES = {'RESOURCE_EXHAUSTED', 'UNAVAILABLE', 'INTERNAL', 'DEADLINE_EXCEEDED'}
+
+def is_retryable(error):
+    """Return True for throttling, server and transport errors that are worth retrying."""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # google.api_core exceptions carry the HTTP status in .code; raw gRPC errors expose a .code() method.
+    code = getattr(error, 'code', None)
+    if callable(code):
+        code = code()
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return getattr(code, 'name', None) in RETRYABLE_GRPC_CODES
+
+def backoff_delay(attempt, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS):
+    # Full jitter: a random delay between zero and the exponential bound spreads retries out evenly.
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def model_key(model):
+    return getattr(model, 'key', None) or getattr(model, '_model_name', None) or getattr(model, 'name', None) or repr(model)
+
+class SlotStream:
+    """Iterator over streamed pieces that gives its concurrency slot back exactly once: when exhausted, closed or collected."""
+
+    def __init__(self, first, pieces, release):
+        self.pending = [] if first is None else [first]
+        self.pieces = iter(()) if first is None else pieces
+        self.release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pending:
+            return self.pending.pop()
+        try:
+            return next(self.pieces)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        release, self.release = self.release, None
+        if release is not None:
+            try:
+                release()
+            except RuntimeError:
+                # The client's loop is already closed at interpreter exit; there is nothing left to release.
+                pass
+
+    __del__ = close
+
+class LLMClient:
+    """Asyncio client that runs blocking LLM calls on a private event loop thread."""
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_retries=MAX_RETRIES, timeout=TIMEOUT_SECONDS):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.semaphores = {}
+        # One event loop for the whole process, so the per-model semaphores really are shared by all sessions.
+        self.loop = asyncio.new_event_loop()
+        # The blocking SDK calls run on this pool; it is sized so the semaphores, not the pool, are the limit.
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=4 * max_concurrency, thread_name_prefix="newsletter-ai-llm"))
+        self.thread = threading.Thread(target=self.loop.run_forever, name="newsletter-ai-llm-client", daemon=True)
+        self.thread.start()
+
+    def deadline(self, timeout=None):
+        return time.monotonic() + (self.timeout if timeout is None else timeout)
+
+    def _semaphore(self, model):
+        key = model_key(model)
+        if key not in self.semaphores:
+            self.semaphores[key] = asyncio.Semaphore(self.max_concurrency)
+        return self.semaphores[key]
+
+    async def _acquire(self, semaphore, deadline):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise TimeoutError("Deadline exceeded while waiting for a free LLM slot.") from None
+
+    def _release_after(self, semaphore, orphaned):
+        if not orphaned:
+            semaphore.release()
+            return
+
+        # A blocking SDK call cannot be interrupted; the slot is only given back once its worker thread returns,
+        # so calls abandoned at their deadline never push the model past its concurrency limit.
+        def release(task):
+            if not task.cancelled():
+                task.exception()
+            semaphore.release()
+        orphaned[0].add_done_callback(release)
+
+    async def _call_with_retries(self, call, deadline, max_retries, model_name, orphaned):
+        try:
+            result = await self._retry(call, deadline, max_retries, model_name, orphaned)
+        except BaseException:
+            metrics.inc('llm_requests_total', model=model_name, outcome='error')
+            raise
+        metrics.inc('llm_requests_total', model=model_name, outcome='ok')
+        return result
+
+    def attempts(self, max_retries):
+        return max(self.max_retries if max_retries is None else max_retries, 1)
+
+    async def _retry(self, call, deadline, max_retries, model_name, orphaned):
+        for attempt in range(max_retries):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Deadline exceeded before the LLM call could be made.")
+            # The blocking SDK call runs in a worker thread; the event loop only waits for it.
+            task = asyncio.ensure_future(asyncio.to_thread(call))
+            try:
+                done, _ = await asyncio.wait({task}, timeout=remaining)
+            except asyncio.CancelledError:
+                orphaned.append(task)
+                raise
+            if not done:
+                # The wait only ends early at the deadline, so there is no further attempt.
+                orphaned.append(task)
+                raise TimeoutError("Deadline exceeded while waiting for the LLM.")
+            try:
+                return task.result()
+            except Exception as e:
+                if not is_retryable(e) or attempt == max_retries - 1:
+                    raise
+                delay = backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                logging.warning(f"Retryable LLM error ({e}); retrying in {delay:.1f}s.")
+                metrics.inc('llm_retries_total', model=model_name)
+                await asyncio.sleep(delay)
+
+    async def call(self, model, call, deadline=None, max_retries=None):
+        """Run call() for model under the model's concurrency limit, retrying retryable errors until deadline."""
+        deadline = deadline or self.deadline()
+        semaphore = self._semaphore(model)
+        await self._acquire(semaphore, deadline)
+        orphaned = []
+        try:
+            return await self._call_with_retries(call, deadline, self.attempts(max_retries), model_key(model), orphaned)
+        finally:
+            self._release_after(semaphore, orphaned)
+
+    async def open_stream(self, model, open_pieces, deadline=None, max_retries=None):
+        """Start a streamed call and wait for its first piece, retrying only until that piece arrives.
+
+        Returns an iterator over all pieces. The model's concurrency slot is held until it is exhausted.
+        """
+        deadline = deadline or self.deadline()
+        semaphore = self._semaphore(model)
+        await self._acquire(semaphore, deadline)
+
+        def first_piece():
+            pieces = open_pieces()
+            return next(pieces, None), pieces
+
+        orphaned = []
+        try:
+            first, pieces = await self._call_with_retries(first_piece, deadline, self.attempts(max_retries), model_key(model), orphaned)
+        except BaseException:
+            self._release_after(semaphore, orphaned)
+            raise
+        # The stream is consumed on the caller's thread; asyncio primitives must be released on their own loop.
+        return SlotStream(first, pieces, lambda: self.loop.call_soon_threadsafe(semaphore.release))
+
+    def run(self, coroutine):
+        """Run a coroutine on the client's loop from synchronous code and return its result."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
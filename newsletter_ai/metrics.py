@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# I have kept a small in-process metrics registry: per-stage latency histograms, cache and LLM counters,
+# and index size gauges. It is exposed in the Prometheus text format on METRICS_PORT (off when 0),
+# and with METRICS_LOG_SPANS=true every stage timing is also logged as one JSON record,
+# so p50/p99 dashboards can be built from either scrapes or logs.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+LOG_SPANS = os.environ.get("METRICS_LOG_SPANS", "false").lower() == "true"
+
+PREFIX = 'newsletter_ai_'
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DESCRIPTIONS = {
+    'stage_seconds': ('histogram', "Latency of each stage of answering a query."),
+    'cache_requests_total': ('counter', "Cache lookups by cache and result (hit or miss)."),
+    'cache_evictions_total': ('counter', "Entries evicted from a full cache."),
+    'cache_invalidations_total': ('counter', "Entries dropped because their source documents changed."),
+    'coalesced_queries_total': ('counter', "Queries that shared the answer of an equivalent query already in flight."),
+    'cache_entries': ('gauge', "Entries held by a cache in this process."),
+    'index_vectors': ('gauge', "Vectors in the FAISS index."),
+    'index_file_bytes': ('gauge', "Size of the FAISS index file."),
+    'chunk_store_chunks': ('gauge', "Chunks in the chunk store."),
+    'chunk_store_bytes': ('gauge', "Bytes of chunk text in the chunk store."),
+    'lexical_index_terms': ('gauge', "Terms in the BM25 index."),
+    'llm_requests_total': ('counter', "LLM calls by model and outcome."),
+    'llm_retries_total': ('counter', "LLM call attempts that were retried."),
+    'llm_tokens_total': ('counter', "LLM tokens by model and kind (prompt or completion), as reported by the backend."),
+}
+
+span_logger = logging.getLogger('newsletter_ai.metrics')
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Registry:
+    """Thread-safe counters, gauges and histograms keyed by metric name and labels."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        # Each histogram holds its per-bucket counts followed by the sum and the count of observations.
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, label_key(labels))
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[position] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self):
+        """Return all metrics in the Prometheus text exposition format."""
+        with self.lock:
+            series = {}
+            for (name, labels), value in self.counters.items():
+                series.setdefault(name, []).append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+            for (name, labels), value in self.gauges.items():
+                series.setdefault(name, []).append(f"{PREFIX}{name}{format_labels(labels)} {value}")
+            for (name, labels), histogram in self.histograms.items():
+                lines = series.setdefault(name, [])
+                for bound, count in zip(LATENCY_BUCKETS, histogram):
+                    lines.append(f"{PREFIX}{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{PREFIX}{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram[-1]}")
+                lines.append(f"{PREFIX}{name}_sum{format_labels(labels)} {histogram[-2]}")
+                lines.append(f"{PREFIX}{name}_count{format_labels(labels)} {histogram[-1]}")
+        output = []
+        for name in sorted(series):
+            kind, description = DESCRIPTIONS.get(name, ('untyped', name))
+            output += [f"# HELP {PREFIX}{name} {description}", f"# TYPE {PREFIX}{name} {kind}", *series[name]]
+        return '\n'.join(output) + '\n'
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set
+observe = REGISTRY.observe
+render = REGISTRY.render
+
+@contextmanager
+def span(stage, **labels):
+    """Time the enclosed block as one stage of a query."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, time.perf_counter() - started, **labels)
+
+def record_span(stage, seconds, **labels):
+    observe('stage_seconds', seconds, stage=stage, **labels)
+    if LOG_SPANS:
+        span_logger.info(json.dumps({"event": "span", "stage": stage, "seconds": round(seconds, 6), **labels}))
+
+def record_token_usage(model_name, prompt_tokens, completion_tokens):
+    inc('llm_tokens_total', prompt_tokens, model=model_name, kind='prompt')
+    inc('llm_tokens_total', completion_tokens, model=model_name, kind='completion')
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; they are not worth a log line each.
+        pass
+
+def start_http_server(port=METRICS_PORT):
+    """Serve /metrics on port in a daemon thread; returns the server, or None when disabled or the port is taken."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    except OSError as e:
+        # Several app processes on one host cannot share the port; the first one serves it.
+        logging.warning(f"Metrics endpoint not started on port {port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="newsletter-ai-metrics", daemon=True).start()
+    logging.info(f"Serving metrics on http://0.0.0.0:{port}/metrics")
+    return server
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import logging
+import time
+from typing import List, TYPE_CHECKING
+
+import numpy as np
+
+from newsletter_ai import curated_answers, metrics, resources
+from newsletter_ai.context_packer import CONTEXT_TOKEN_BUDGET, pack_context
+from newsletter_ai.lexical_index import HYBRID_RETRIEVAL, LEXICAL_CONFIDENCE, LEXICAL_SKIP_DENSE, fuse
+from newsletter_ai.llm_client import model_key
+from newsletter_ai.semantic_cache import ANSWER_CACHE_THRESHOLD
+from newsletter_ai.single_flight import SingleFlight
+
+if TYPE_CHECKING:
+    from newsletter_ai.llm_backends import LLMBackend
+
+# I have kept the retrieval-augmented generation pipeline here, apart from the Streamlit page,
+# so the chatbot and the batch tools answer questions with exactly the same code.
+
+PROMPT_TEMPLATE = """Based on the following context, please answer the question. If the answer is not fully contained in the context, provide the most relevant information available and indicate any uncertainty.
+
+Context:
+{context}
+
+Question: {query}
+
+Answer:"""
+
+# Default configuration setup for response generation, ensuring controlled output.
+GENERATION_SETTINGS = {"temperature": 0.7, "max_output_tokens": 1024}
+
+# Cached answers are only reused while the prompt, context budget and generation settings that produced them are unchanged.
+PROMPT_HASH = hashlib.md5(json.dumps([PROMPT_TEMPLATE, CONTEXT_TOKEN_BUDGET, GENERATION_SETTINGS], sort_keys=True).encode()).hexdigest()
+
+# Bumped whenever the shape of cached payloads changes; entries of an older format are never served and age out.
+CACHE_FORMAT = 2
+
+def retrieve_from_cache(query_embedding, threshold=0.5):
+    # I have implemented semantic caching to reuse results for similar queries.
+    # This significantly reduces API calls and improves response times.
+    # The cache keeps all embeddings in one contiguous matrix, so a lookup is a single vectorized distance computation.
+    with metrics.span('retrieval_cache'):
+        return resources.get_query_cache().lookup(query_embedding, threshold, f"v{CACHE_FORMAT}")
+
+def update_cache(query, query_embedding, response, documents=(), corpus_version=None):
+    # I have updated the cache with new queries to continually improve performance.
+    # It is backed by SQLite, so every write is one row and all worker processes share the same entries.
+    # Each entry is tagged with its source documents, so changing one newsletter only invalidates the entries that used it.
+    # A query still answered from the previous corpus version after a swap does not store its results.
+    resources.get_query_cache().add(query, query_embedding, response, f"v{CACHE_FORMAT}", documents=documents, corpus_version=corpus_version)
+
+def source_documents(chunk_ids, chunks):
+    return sorted({chunks.document(chunk_id) for chunk_id in chunk_ids})
+
+def answer_scope(model):
+    # An answer is only valid for the model and prompt that produced it; its source documents are checked separately.
+    return f"{model_key(model)}:{PROMPT_HASH}:v{CACHE_FORMAT}"
+
+def retrieve_cached_answer(query_embedding, model, corpus_version):
+    """Return the cached {"answer", "chunk_ids"} for a query near query_embedding, or None."""
+    # I have cached whole answers on top of the retrieval cache, so a repeated question skips Gemini entirely.
+    # Without a corpus version there is no way to tell whether an answer is current, so nothing is served.
+    if corpus_version is None:
+        return None
+    with metrics.span('answer_cache'):
+        return resources.get_answer_cache().lookup(query_embedding, ANSWER_CACHE_THRESHOLD, answer_scope(model))
+
+# Queries in flight in this process, grouped by model scope and corpus version; equivalent means within the answer cache threshold.
+in_flight = SingleFlight(ANSWER_CACHE_THRESHOLD)
+
+def store_answer(query, query_embedding, model, corpus_version, answer, chunk_ids, chunks, replace=False):
+    # With replace, earlier answers to the same question are dropped, so the new one is served instead of them.
+    if corpus_version is None or not answer:
+        return
+    resources.get_answer_cache().add(
+        query, query_embedding, {"answer": answer, "chunk_ids": chunk_ids, "corpus_version": corpus_version}, answer_scope(model),
+        documents=source_documents(chunk_ids, chunks), corpus_version=corpus_version,
+        replace_threshold=ANSWER_CACHE_THRESHOLD if replace else None,
+    )
+
+def lexical_fast_path(query, lexical_index, top_k=10):
+    """Return the chunk ids BM25 finds for query if it is confident enough to skip the dense encoder, else None."""
+    if lexical_index is None or not LEXICAL_SKIP_DENSE:
+        return None
+    with metrics.span('lexical_search'):
+        hits = lexical_index.search(query, top_k)
+    if not hits.chunk_ids or hits.confidence < LEXICAL_CONFIDENCE:
+        return None
+    logging.info(f"Lexical fast path (confidence {hits.confidence:.2f}): skipping the dense encoder.")
+    return hits.chunk_ids
+
+def rank_chunk_ids(query, dense_ids, lexical_index, top_k):
+    # The index returns manifest chunk ids; -1 marks an empty result slot.
+    if lexical_index is None or not HYBRID_RETRIEVAL:
+        return [int(i) for i in dense_ids if i != -1]
+    # I have fused the dense ranking with BM25, so exact product names surface even when the embedding blurs them.
+    with metrics.span('lexical_search'):
+        hits = lexical_index.search(query, top_k)
+    return [int(i) for i in fuse(dense_ids, hits.chunk_ids, top_k)]
+
+def encode_query(query):
+    # The curated questions are encoded once per process by the answer warm-up.
+    precomputed = curated_answers.EMBEDDINGS.get(query)
+    if precomputed is not None:
+        return precomputed
+    with metrics.span('encode'):
+        return resources.get_encoder().encode([query])[0]
+
+def retrieve_relevant_chunks(query, index, chunks, top_k=10, query_vector=None, lexical_index=None, corpus_version=None):
+    """Return the ids of the chunks most relevant to query."""
+    # I have used vector similarity to find the most relevant chunks.
+    # This is more effective than keyword matching for understanding context and semantics.
+    if query_vector is None:
+        query_vector = encode_query(query)
+
+    cached_response = retrieve_from_cache(query_vector)
+    if cached_response:
+        logging.info("Answer recovered from Cache.")
+        return cached_response
+
+    # I have limited top_k to avoid retrieving more chunks than available.
+    top_k = min(top_k, len(chunks))
+    with metrics.span('faiss_search'):
+        D, I = index.search(np.array([query_vector]).astype('float32'), top_k)
+    chunk_ids = rank_chunk_ids(query, I[0], lexical_index, top_k)
+
+    update_cache(query, query_vector, chunk_ids, source_documents(chunk_ids, chunks), corpus_version)
+    return chunk_ids
+
+def outranked_by_newer_chunks(index, top_k=10):
+    """Return recheck(query embeddings, chunk id limits) for the caches: True where a chunk added since an entry's limit
+    is now among its query's top_k nearest chunks in index."""
+    def recheck(query_embeddings, chunk_id_limits):
+        with metrics.span('faiss_search'):
+            D, I = index.search(np.asarray(query_embeddings, dtype='float32'), max(min(top_k, index.ntotal), 1))
+        return (I >= np.asarray(chunk_id_limits)[:, None]).any(axis=1)
+    return recheck
+
+def pack(chunk_ids, chunks):
+    """Return (context passages, ids of the chunks they contain) for the ranked chunk_ids."""
+    # Overlapping chunks are merged and the context is cut at a token budget, so every prompt is smaller.
+    # Ids from a cache entry whose document has just been replaced are skipped rather than failing the query.
+    with metrics.span('pack_context'):
+        passages, used_ids = pack_context(chunk_ids, chunks)
+    logging.info(f"Packed {len(used_ids)} of {len(chunk_ids)} chunks into {len(passages)} passages.")
+    return passages, used_ids
+
+def build_prompt(query: str, relevant_chunks: List[str]) -> str:
+    context = "\n".join(relevant_chunks)
+    return PROMPT_TEMPLATE.format(context=context, query=query)
+
+def generate_response(query: str, relevant_chunks: List[str], model: "LLMBackend", max_retries: int = None, deadline=None):
+    # I have used a language model to generate responses based on retrieved chunks.
+    # This allows for more natural and contextually appropriate answers.
+    with metrics.span('build_prompt'):
+        prompt = build_prompt(query, relevant_chunks)
+
+    # I have implemented retry logic for robustness.
+    # This ensures the system can handle API errors gracefully.
+    # The LLM client retries throttling and server errors with jittered exponential backoff under a per-model concurrency limit.
+    client = resources.get_llm_client()
+    call = lambda: model.generate(prompt, GENERATION_SETTINGS)
+    with metrics.span('llm_generate', model=model_key(model)):
+        response = client.run(client.call(model, call, deadline=deadline, max_retries=max_retries))
+    return response, relevant_chunks
+
+def stream_response(query: str, relevant_chunks: List[str], model: "LLMBackend", max_retries: int = None, deadline=None):
+    """Yield the answer text piece by piece as Gemini generates it."""
+    with metrics.span('build_prompt'):
+        prompt = build_prompt(query, relevant_chunks)
+
+    # I have retried only until the first piece arrives; once text is on screen a retry would repeat it.
+    client = resources.get_llm_client()
+    # The backend returns an iterator over the answer's text pieces, so callers can show tokens as they arrive.
+    open_pieces = lambda: model.stream(prompt, GENERATION_SETTINGS)
+    started = time.perf_counter()
+    with metrics.span('llm_first_token', model=model_key(model)):
+        pieces = client.run(client.open_stream(model, open_pieces, deadline=deadline, max_retries=max_retries))
+    yield from pieces
+    metrics.record_span('llm_stream', time.perf_counter() - started, model=model_key(model))
+
+def rag_query(query: str, index, chunks, model: "LLMBackend", top_k: int = 10, corpus_version=None, lexical_index=None,
+              deadline=None) -> tuple:
+    """Answer query in one piece and return (response, source_docs)."""
+    # I have combined retrieval and generation for a complete RAG pipeline.
+    # RAG allows us to ground the model's responses in specific, relevant information.
+    # It joins the streamed answer, so both share the caches and the coalescing of identical queries.
+    with metrics.span('rag_query'):
+        answer_pieces, source_docs = rag_query_stream(query, index, chunks, model, top_k, corpus_version, lexical_index, deadline)
+        return "".join(answer_pieces), source_docs
+
+def rag_query_stream(query: str, index, chunks, model: "LLMBackend", top_k: int = 10, corpus_version=None, lexical_index=None,
+                     deadline=None) -> tuple:
+    """Retrieve sources up front and return (answer piece generator, source_docs)."""
+    # Retrieval is timed as 'retrieval'; the generator times the first token and the whole stream itself.
+    deadline = deadline or resources.get_llm_client().deadline()
+    with metrics.span('retrieval'):
+        lexical_ids = lexical_fast_path(query, lexical_index, top_k)
+        if lexical_ids is not None:
+            passages, used_ids = pack(lexical_ids, chunks)
+            return stream_response(query, passages, model, deadline=deadline), group_by_source(used_ids, chunks)
+
+        query_vector = encode_query(query)
+        cached = retrieve_cached_answer(query_vector, model, corpus_version)
+        if cached:
+            logging.info("Answer recovered from answer cache.")
+            return iter([cached["answer"]]), group_by_source(cached["chunk_ids"], chunks)
+
+        # I have let an equivalent query that is already being answered in this process answer this one too,
+        # so a burst of sessions asking the same question makes one Gemini call.
+        flight, leader = in_flight.join((answer_scope(model), corpus_version), query_vector)
+        if not leader:
+            logging.info("Following an equivalent query already in flight.")
+            return flight.follow(deadline), flight.wait_for_sources(deadline)
+
+        # I have separated retrieval from generation, so the sources can be shown before the first token arrives.
+        try:
+            chunk_ids = retrieve_relevant_chunks(query, index, chunks, top_k, query_vector, lexical_index, corpus_version)
+            passages, used_ids = pack(chunk_ids, chunks)
+            source_docs = group_by_source(used_ids, chunks)
+        except BaseException as e:
+            in_flight.finish(flight, e)
+            raise
+        flight.set_sources(source_docs)
+        pieces = stream_response(query, passages, model, deadline=deadline)
+        store = lambda answer: store_answer(query, query_vector, model, corpus_version, answer, used_ids, chunks)
+        # The answer is generated on a worker thread and stored before the flight ends, so later queries find it
+        # in the cache instead, whether or not this session reads it.
+        return in_flight.lead(flight, collect_and_store(pieces, store), deadline), source_docs
+
+def collect_and_store(pieces, store):
+    # The answer is only cached once the stream has completed, so an interrupted answer is never served again.
+    collected = []
+    for piece in pieces:
+        collected.append(piece)
+        yield piece
+    store("".join(collected))
+
+def group_by_source(chunk_ids, chunks):
+    # I have tracked source documents for transparency and citation.
+    source_docs = {}
+    for chunk_id in chunk_ids:
+        if chunk_id not in chunks:
+            continue
+        doc_name = chunks.document(chunk_id)
+        if doc_name not in source_docs:
+            source_docs[doc_name] = []
+        source_docs[doc_name].append(chunks[chunk_id])
+    return source_docs
+
+def retrieve_relevant_chunks_batch(queries, index, chunks, top_k=10, query_vectors=None, lexical_index=None, corpus_version=None):
+    """Retrieve chunk ids for many queries with one encoder call and one index search."""
+    # I have encoded all queries as one batch, which amortizes the transformer's per-call overhead.
+    if query_vectors is None:
+        with metrics.span('encode'):
+            query_vectors = np.asarray(resources.get_encoder().encode(queries), dtype='float32')
+
+    results = [retrieve_from_cache(query_vector) for query_vector in query_vectors]
+    misses = [position for position, cached in enumerate(results) if not cached]
+    if misses:
+        # The cache misses are searched together: FAISS handles a query matrix far faster than row by row.
+        top_k = min(top_k, len(chunks))
+        with metrics.span('faiss_search'):
+            D, I = index.search(query_vectors[misses], top_k)
+        for position, ids in zip(misses, I):
+            results[position] = rank_chunk_ids(queries[position], ids, lexical_index, top_k)
+            update_cache(queries[position], query_vectors[position], results[position], source_documents(results[position], chunks), corpus_version)
+    logging.info(f"Batch retrieval: {len(queries) - len(misses)} of {len(queries)} queries answered from cache.")
+    return results
+
+def rag_query_batch(queries, index, chunks, model: "LLMBackend", top_k: int = 10, max_concurrency: int = 4,
+                    corpus_version=None, lexical_index=None, deadline=None, query_vectors=None, reuse_older_answers=True):
+    """Answer many queries, returning (query, response, source_docs, error) tuples in input order.
+
+    With deadline set, every Gemini call of the batch must finish by it. query_vectors may hold the queries'
+    embeddings if they are already known. With reuse_older_answers off, cached answers generated under another
+    corpus version are generated again and replace the cached ones.
+    """
+    import asyncio
+
+    if query_vectors is None:
+        with metrics.span('encode'):
+            query_vectors = np.asarray(resources.get_encoder().encode(queries), dtype='float32')
+    results = [None] * len(queries)
+    for position, query_vector in enumerate(query_vectors):
+        cached = retrieve_cached_answer(query_vector, model, corpus_version)
+        if cached and not reuse_older_answers and cached.get("corpus_version") != corpus_version:
+            cached = None
+        if cached:
+            results[position] = (queries[position], cached["answer"], group_by_source(cached["chunk_ids"], chunks), None)
+    misses = [position for position, result in enumerate(results) if result is None]
+    logging.info(f"Batch answers: {len(queries) - len(misses)} of {len(queries)} queries answered from the answer cache.")
+    if not misses:
+        return results
+
+    relevant_ids = retrieve_relevant_chunks_batch([queries[p] for p in misses], index, chunks, top_k, query_vectors[misses], lexical_index, corpus_version)
+    client = resources.get_llm_client()
+
+    # I have fanned the Gemini calls out on the LLM client's event loop. The batch's own limit sits on top of the
+    # client's per-model limit, so a large batch cannot exceed our Vertex quota or starve interactive sessions.
+    async def answer_all():
+        batch_slots = asyncio.Semaphore(max_concurrency)
+
+        async def answer(query, used_ids, passages):
+            prompt = build_prompt(query, passages)
+            async with batch_slots:
+                try:
+                    started = time.perf_counter()
+                    # Each question's deadline starts once it has a batch slot, so queueing behind the batch does not eat into it.
+                    response = await client.call(model, lambda: model.generate(prompt, GENERATION_SETTINGS), deadline=deadline or client.deadline())
+                    metrics.record_span('llm_generate', time.perf_counter() - started, model=model_key(model))
+                    return query, response, group_by_source(used_ids, chunks), None
+                except Exception as e:
+                    # One failed question is reported in its output line rather than aborting the whole batch.
+                    return query, None, {}, str(e)
+
+        return await asyncio.gather(*(answer(queries[position], used_ids, passages) for position, (passages, used_ids) in zip(misses, packed)))
+
+    packed = [pack(chunk_ids, chunks) for chunk_ids in relevant_ids]
+    for position, (_, used_ids), result in zip(misses, packed, client.run(answer_all())):
+        results[position] = result
+        store_answer(queries[position], query_vectors[position], model, corpus_version, result[1], used_ids, chunks,
+                     replace=not reuse_older_answers)
+    return results
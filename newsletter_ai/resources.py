@@ -0,0 +1,222 @@
+import functools
+import logging
+import os
+import threading
+import time
+
+from newsletter_ai import ingestion, metrics
+
+# I have loaded a pre-trained sentence transformer model for generating text embeddings.
+# I chose 'all-mpnet-base-v2' for its balance of performance and accuracy.
+# This model is crucial for converting text to vector representations for similarity search.
+MODEL_NAME = 'all-mpnet-base-v2'
+
+# https://cloud.google.com/vertex-ai/generative-ai/docs/model-reference/inference#supported-models
+GEMINI_MODEL_NAMES = ["gemini-1.5-flash-001", "gemini-1.5-pro-001"]
+
+_MISSING = object()
+
+def lazy_resource(loader):
+    """Build a resource on first use and share it across threads."""
+    lock = threading.Lock()
+    value = _MISSING
+
+    @functools.wraps(loader)
+    def get():
+        nonlocal value
+        if value is not _MISSING:
+            return value
+        with lock:
+            if value is _MISSING:
+                started = time.perf_counter()
+                value = loader()
+                logging.info(f"Loaded {loader.__name__} in {time.perf_counter() - started:.2f}s.")
+            return value
+
+    return get
+
+# I have kept heavy imports (PyTorch, sentence-transformers, FAISS, Vertex AI) inside the loaders below.
+# Importing this module is cheap, so the Streamlit page renders before any model is loaded.
+
+@lazy_resource
+def get_bundle():
+    """Open the index bundle named by INDEX_BUNDLE; returns None when the app ingests input_files/ itself."""
+    from newsletter_ai import bundle
+    if not bundle.BUNDLE_PATH:
+        return None
+    return bundle.Bundle.open(bundle.BUNDLE_PATH, MODEL_NAME)
+
+@lazy_resource
+def get_encoder():
+    from newsletter_ai import encoder_backends
+    index_bundle = get_bundle()
+    if index_bundle is None:
+        return encoder_backends.load_encoder(MODEL_NAME, MODEL_NAME)
+    # The bundle carries the encoder weights and their reference embeddings, so nothing is fetched from the Hugging Face hub.
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    from newsletter_ai.bundle import ENCODER_DIRECTORY, ENCODER_REFERENCE_FILE
+    reference_file = index_bundle.file(ENCODER_REFERENCE_FILE)
+    if not os.path.exists(reference_file):
+        reference_file = encoder_backends.REFERENCE_FILE
+    return encoder_backends.load_encoder(index_bundle.file(ENCODER_DIRECTORY), MODEL_NAME, reference_file=reference_file)
+
+@lazy_resource
+def get_embedding_store():
+    from newsletter_ai.embedding_store import EmbeddingStore
+    # The encoder is only loaded if some chunk text is not in the embedding cache yet.
+    return EmbeddingStore(MODEL_NAME, lambda texts: get_encoder().encode(texts))
+
+@lazy_resource
+def get_query_cache():
+    from newsletter_ai.semantic_cache import CACHE_FILE, SemanticCache
+    return SemanticCache(MODEL_NAME, CACHE_FILE)
+
+@lazy_resource
+def get_answer_cache():
+    from newsletter_ai import semantic_cache
+    return semantic_cache.SemanticCache(
+        MODEL_NAME,
+        semantic_cache.CACHE_FILE,
+        max_entries=semantic_cache.ANSWER_CACHE_MAX_ENTRIES,
+        table=semantic_cache.ANSWER_CACHE_TABLE,
+        ttl_seconds=semantic_cache.ANSWER_CACHE_TTL_SECONDS,
+    )
+
+def build_corpus(files_hash):
+    """Build the corpus for the input files: the chunk store, the FAISS index and the BM25 index of their version."""
+    index_bundle = get_bundle()
+    if index_bundle is not None:
+        # A bundle is immutable and already holds all of them; they are only opened.
+        return index_bundle.load_corpus()
+    from newsletter_ai import lexical_index, vector_index
+    from newsletter_ai.chunk_store import load_or_build_store
+    from newsletter_ai.corpus import Corpus
+    # Only PDFs that are new or changed since the last run are extracted; the rest come from the manifest.
+    manifest = ingestion.update_manifest(ingestion.PDF_DIRECTORY, ingestion.MANIFEST_FILE)
+    version = ingestion.corpus_version(manifest)
+    # The manifest is dropped after this call; queries read chunk text from the memory-mapped store.
+    chunks = load_or_build_store(manifest, version)
+    document_hashes = {filename: entry['hash'] for filename, entry in manifest['documents'].items()}
+
+    # I have used FAISS for efficient similarity search.
+    # This is crucial for quickly finding relevant chunks when answering queries.
+    # The saved index is updated in place: vectors of removed documents are deleted by id and only new chunks are encoded.
+    # The index is opened memory-mapped, so all Streamlit workers on the host share one copy in the page cache.
+    index = vector_index.load_or_update_index(chunks, get_embedding_store().encode, version)
+    # The BM25 index is tiny next to the vector index, and building it only tokenizes the chunks.
+    lexical = lexical_index.load_or_build_index(chunks, version)
+
+    # I have used logging to help with debugging and monitoring the chunking process.
+    logging.info(f"Total chunks: {len(chunks)}")
+    if len(chunks):
+        logging.info(f"Sample chunk: {next(iter(chunks.values()))[:100]}...")
+    return Corpus(files_hash, version, chunks, index, lexical, document_hashes, vector_index.index_path(version))
+
+def activate_corpus(corpus):
+    # I have told the caches which document versions are current only now, at the swap, so queries still answered
+    # from the previous version cannot cache results under the new documents' hashes.
+    # Entries from before a newsletter was added are searched against the new index once, in one batch,
+    # and dropped if one of its chunks would now be retrieved for them.
+    from newsletter_ai.rag import outranked_by_newer_chunks
+    recheck = outranked_by_newer_chunks(corpus.index)
+    get_query_cache().set_documents(corpus.document_hashes, corpus.version, corpus.chunk_id_limit, recheck)
+    get_answer_cache().set_documents(corpus.document_hashes, corpus.version, corpus.chunk_id_limit, recheck)
+
+    metrics.set_gauge('chunk_store_chunks', len(corpus.chunks))
+    metrics.set_gauge('chunk_store_bytes', len(corpus.chunks.blob))
+    metrics.set_gauge('index_vectors', corpus.index.ntotal)
+    metrics.set_gauge('index_file_bytes', os.path.getsize(corpus.index_file))
+    metrics.set_gauge('lexical_index_terms', len(corpus.lexical_index.vocabulary))
+
+@lazy_resource
+def get_corpus_manager():
+    from newsletter_ai.corpus import CorpusManager
+    return CorpusManager(build_corpus, activate_corpus)
+
+def get_corpus(files_hash):
+    """Return the Corpus to answer a query with; if the input files changed, the new version is built in the background."""
+    return get_corpus_manager().get(files_hash)
+
+@lazy_resource
+def get_input_watcher():
+    """Start the input directory watcher once per process when INPUT_WATCHER is on; returns None otherwise."""
+    from newsletter_ai import watcher
+    if not watcher.WATCH_INPUT_FILES or get_bundle() is not None:
+        return None
+    # A change starts the background rebuild straight away, without waiting for a query to notice it.
+    return watcher.InputWatcher(ingestion.PDF_DIRECTORY, lambda files_hash: get_corpus_manager().rebuild(files_hash)).start()
+
+def current_files_hash():
+    """Return the hash of the input files: kept current by the watcher when it runs, else from a stat scan."""
+    # Only files whose size, mtime or inode changed are read, so this stays cheap on the query path.
+    # A bundle never changes while the app runs; a new corpus ships as a new bundle.
+    index_bundle = get_bundle()
+    if index_bundle is not None:
+        return index_bundle.files_hash
+    watcher = get_input_watcher()
+    if watcher is not None:
+        return watcher.files_hash
+    return ingestion.get_files_hash(ingestion.PDF_DIRECTORY)
+
+@lazy_resource
+def load_models():
+    """Load the Gemini 1.5 Flash and Pro models from the configured LLM backend (Vertex AI or the local stand-in)."""
+    from newsletter_ai.llm_backends import load_backends
+    return load_backends(GEMINI_MODEL_NAMES)
+
+@lazy_resource
+def get_llm_client():
+    from newsletter_ai.llm_client import LLMClient
+    return LLMClient()
+
+def warm_up():
+    # I have loaded everything the first query needs, in the order the query needs it.
+    # Each loader is shared, so a query arriving mid warm-up simply waits for the step in progress.
+    started = time.perf_counter()
+    get_corpus(current_files_hash())
+    get_encoder().encode(["warm-up"])
+    get_query_cache()
+    get_answer_cache()
+    load_models()
+    logging.info(f"Warm-up finished in {time.perf_counter() - started:.2f}s.")
+
+@lazy_resource
+def start_metrics_server():
+    """Serve the Prometheus metrics endpoint on METRICS_PORT, once per process; does nothing when it is 0."""
+    return metrics.start_http_server()
+
+@lazy_resource
+def start_answer_warm_up():
+    """Precompute the curated questions' answers for every corpus version this process serves, in the background."""
+    from newsletter_ai import curated_answers
+    if not curated_answers.WARM_UP_ANSWERS:
+        return None
+    manager = get_corpus_manager()
+
+    def warm_up_answers(corpus):
+        def run():
+            try:
+                curated_answers.precompute(corpus, load_models(), lambda: manager.current is corpus)
+            except Exception:
+                # The questions are still answered on demand; the warm-up only saves their first users the wait.
+                logging.exception("Answer warm-up failed.")
+
+        threading.Thread(target=run, name="newsletter-ai-answer-warm-up", daemon=True).start()
+
+    # Subscribing also warms up the corpus already being served, if there is one.
+    manager.subscribe(warm_up_answers)
+    return manager
+
+@lazy_resource
+def start_warm_up():
+    """Start warm_up in a background thread, once per process."""
+    def run():
+        try:
+            warm_up()
+        except Exception:
+            # A failed warm-up only costs latency; the query path loads whatever is missing itself.
+            logging.exception("Warm-up failed.")
+
+    thread = threading.Thread(target=run, name="newsletter-ai-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,400 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from newsletter_ai import metrics
+
+# I have initialized a cache for storing query results.
+# Caching improves response times for repeated or similar queries.
+# The cache lives in SQLite (WAL mode), so every Streamlit worker process on the host can share it
+# and each new entry is a single-row insert instead of a rewrite of the whole file.
+CACHE_FILE = 'semantic_cache.db'
+
+# I have bounded the cache so lookups stay cheap however long the app runs.
+# Once full, the least recently used ('lru') or least frequently used ('lfu') entry is replaced.
+MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 10000))
+EVICTION_POLICY = os.environ.get("SEMANTIC_CACHE_EVICTION", "lru").lower()
+
+# Generated answers are cached in their own table, scoped to the model, prompt and corpus version that produced them.
+# They expire after a TTL, and the match threshold is tighter than for retrieval, since a near miss returns a whole answer.
+ANSWER_CACHE_TABLE = 'answer_cache'
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", 5000))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get("ANSWER_CACHE_TTL_SECONDS", 24 * 60 * 60))
+ANSWER_CACHE_THRESHOLD = float(os.environ.get("ANSWER_CACHE_THRESHOLD", 0.3))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    model_name TEXT NOT NULL,
+    query TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    response TEXT NOT NULL,
+    last_used INTEGER NOT NULL,
+    hit_count INTEGER NOT NULL DEFAULT 0,
+    scope TEXT NOT NULL DEFAULT '',
+    created_at INTEGER NOT NULL DEFAULT 0,
+    documents TEXT,
+    corpus_version TEXT,
+    chunk_id_limit INTEGER
+)
+"""
+
+# Columns added after the first release of the SQLite cache; older databases are migrated in place.
+ADDED_COLUMNS = {
+    'scope': "TEXT NOT NULL DEFAULT ''",
+    'created_at': "INTEGER NOT NULL DEFAULT 0",
+    'documents': "TEXT",
+    'corpus_version': "TEXT",
+    'chunk_id_limit': "INTEGER",
+}
+
+# I have logged every deleted row id with a trigger, so each process can also drop the entries other processes
+# evicted, invalidated or replaced, not only pick up the ones they inserted. The log is pruned after a day;
+# a process that has fallen behind the pruned part re-reads the ids of all live rows instead.
+DELETIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table}_deletions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    row_id INTEGER NOT NULL,
+    deleted_at INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS {table}_log_deletion AFTER DELETE ON {table}
+BEGIN
+    INSERT INTO {table}_deletions (row_id, deleted_at) VALUES (old.id, CAST(strftime('%s', 'now') AS INTEGER));
+END;
+"""
+DELETIONS_RETENTION_SECONDS = 24 * 60 * 60
+
+def connect(cache_file, table='semantic_cache'):
+    # check_same_thread is off because Streamlit serves sessions from several threads; SemanticCache serializes access itself.
+    connection = sqlite3.connect(cache_file, timeout=30, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(SCHEMA.format(table=table))
+    connection.executescript(DELETIONS_SCHEMA.format(table=table))
+    existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table})")}
+    for column, definition in ADDED_COLUMNS.items():
+        if column not in existing:
+            connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return connection
+
+class SemanticCache:
+    """Semantic cache of query embeddings held in one contiguous float32 matrix and persisted in SQLite.
+
+    Every entry belongs to a scope string and a lookup only matches entries of its own scope.
+    With ttl_seconds set, entries older than that are ignored and evicted first.
+    Entries are tagged with the source documents they were built from and the hash of each;
+    set_documents drops only the entries whose documents have since changed or been removed.
+    Entries also record the corpus's chunk id limit when they were written. Chunk ids only grow, so chunks at or
+    above it were added later; set_documents asks recheck whether such chunks now rank into an older entry's results.
+    """
+
+    def __init__(self, model_name, cache_file=CACHE_FILE, max_entries=MAX_ENTRIES, eviction_policy=EVICTION_POLICY,
+                 table='semantic_cache', ttl_seconds=None):
+        if eviction_policy not in ('lru', 'lfu'):
+            raise ValueError(f"Unknown semantic cache eviction policy: {eviction_policy}")
+        self.model_name = model_name
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.eviction_policy = eviction_policy
+        self.table = table
+        self.ttl_ns = None if ttl_seconds is None else int(ttl_seconds * 1e9)
+        self.lock = threading.Lock()
+        self.queries = []
+        self.responses = []
+        # Per entry, the {filename: file hash} of the documents it was built from; None for untagged entries.
+        self.dependencies = []
+        # The current {filename: file hash} of the corpus, once known.
+        self.document_hashes = None
+        self.corpus_version = None
+        # One above the highest chunk id of the current corpus, and recheck(query embeddings, chunk id limits),
+        # which returns a mask of the entries that chunks added since their limit would now rank into.
+        self.chunk_id_limit = None
+        self.recheck = None
+        # Rows [0, size) of these arrays are in use; the rest is spare capacity that grows by doubling.
+        self.embeddings = None
+        self.sq_norms = np.zeros(0, dtype='float32')
+        self.last_used = np.zeros(0, dtype='int64')
+        self.hit_counts = np.zeros(0, dtype='int64')
+        self.row_ids = np.zeros(0, dtype='int64')
+        self.created = np.zeros(0, dtype='int64')
+        self.chunk_id_limits = np.zeros(0, dtype='int64')
+        # Scopes are interned to small integers, so filtering by scope is a vectorized comparison too.
+        self.scope_ids = np.zeros(0, dtype='int32')
+        self.scope_numbers = {}
+        self.size = 0
+        # Highest database id seen so far; rows above it were written by other processes.
+        self.last_seen_id = 0
+        # Last entry of the deletions log applied to the arrays.
+        self.last_deletion = 0
+        self.connection = connect(cache_file, table)
+        self.load()
+
+    def __len__(self):
+        return self.size
+
+    def _reserve(self, dimension):
+        if self.embeddings is None:
+            capacity = min(self.max_entries, 1024)
+            self.embeddings = np.zeros((capacity, dimension), dtype='float32')
+        elif self.size == len(self.embeddings):
+            capacity = min(self.max_entries, 2 * len(self.embeddings))
+            self.embeddings = np.resize(self.embeddings, (capacity, dimension))
+        else:
+            return
+        capacity = len(self.embeddings)
+        self.sq_norms = np.resize(self.sq_norms, capacity)
+        self.last_used = np.resize(self.last_used, capacity)
+        self.hit_counts = np.resize(self.hit_counts, capacity)
+        self.row_ids = np.resize(self.row_ids, capacity)
+        self.created = np.resize(self.created, capacity)
+        self.chunk_id_limits = np.resize(self.chunk_id_limits, capacity)
+        self.scope_ids = np.resize(self.scope_ids, capacity)
+
+    def _scope_number(self, scope):
+        return self.scope_numbers.setdefault(scope, len(self.scope_numbers))
+
+    def _is_current(self, dependencies):
+        if self.document_hashes is None:
+            return True
+        if dependencies is None:
+            return False
+        # A dependency tagged None was not known when the entry was written, so it can never be confirmed as current.
+        return all(
+            file_hash is not None and self.document_hashes.get(filename) == file_hash
+            for filename, file_hash in dependencies.items()
+        )
+
+    def _store_row(self, row_id, query, embedding, response, last_used, hit_count, scope='', created_at=0, dependencies=None,
+                   chunk_id_limit=0):
+        if self.embeddings is not None and embedding.shape[0] != self.embeddings.shape[1]:
+            logging.warning("Cached embedding dimension mismatch. Skipping cache entry.")
+            return
+        if self.size >= self.max_entries:
+            row = self._victim()
+            logging.info(f"Semantic cache full. Evicting cached query: {self.queries[row]}")
+            metrics.inc('cache_evictions_total', cache=self.table)
+            self.connection.execute(f"DELETE FROM {self.table} WHERE id = ?", (int(self.row_ids[row]),))
+            self.queries[row] = query
+            self.responses[row] = response
+            self.dependencies[row] = dependencies
+        else:
+            self._reserve(embedding.shape[0])
+            row = self.size
+            self.size += 1
+            self.queries.append(query)
+            self.responses.append(response)
+            self.dependencies.append(dependencies)
+        self.embeddings[row] = embedding
+        self.sq_norms[row] = embedding @ embedding
+        self.last_used[row] = last_used
+        self.hit_counts[row] = hit_count
+        self.row_ids[row] = row_id
+        # Rows written before created_at existed fall back to their last use.
+        self.created[row] = created_at or last_used
+        self.chunk_id_limits[row] = chunk_id_limit
+        self.scope_ids[row] = self._scope_number(scope)
+        metrics.set_gauge('cache_entries', self.size, cache=self.table)
+
+    def _forget_deleted(self):
+        deletions = self.connection.execute(
+            f"SELECT seq, row_id FROM {self.table}_deletions WHERE seq > ? ORDER BY seq", (self.last_deletion,),
+        ).fetchall()
+        if not deletions:
+            return
+        if deletions[0][0] > self.last_deletion + 1:
+            # Part of the log since the last look has been pruned, so the live ids are read instead.
+            live = [row_id for row_id, in self.connection.execute(f"SELECT id FROM {self.table} WHERE model_name = ?", (self.model_name,))]
+            gone = ~np.isin(self.row_ids[:self.size], live)
+        else:
+            gone = np.isin(self.row_ids[:self.size], [row_id for _, row_id in deletions])
+        self.last_deletion = deletions[-1][0]
+        if gone.any():
+            self._keep(np.flatnonzero(~gone).tolist())
+
+    def _refresh(self):
+        # I have pulled in only the rows other processes added or deleted since the last look, so this stays cheap.
+        self._forget_deleted()
+        rows = self.connection.execute(
+            f"SELECT id, query, embedding, response, last_used, hit_count, scope, created_at, documents, corpus_version, chunk_id_limit "
+            f"FROM {self.table} WHERE model_name = ? AND id > ? ORDER BY id",
+            (self.model_name, self.last_seen_id),
+        ).fetchall()
+        for row_id, query, embedding, response, last_used, hit_count, scope, created_at, documents, corpus_version, chunk_id_limit in rows:
+            self.last_seen_id = max(self.last_seen_id, row_id)
+            dependencies = None if documents is None else json.loads(documents)
+            # A process still serving an older corpus may write entries this one must not serve.
+            if not self._is_current(dependencies):
+                continue
+            if chunk_id_limit is None:
+                # Rows written before chunk id limits were recorded are only trusted if they come from the current corpus.
+                current = corpus_version is not None and corpus_version == self.corpus_version
+                chunk_id_limit = self.chunk_id_limit if current and self.chunk_id_limit is not None else 0
+            embedding = np.frombuffer(embedding, dtype='float32')
+            self._store_row(row_id, query, embedding, json.loads(response), last_used, hit_count, scope, created_at, dependencies,
+                            chunk_id_limit)
+        if rows:
+            self._recheck_older()
+
+    def _keep(self, rows):
+        # I have compacted the arrays to the surviving rows; invalidation is rare, so a copy is cheap enough.
+        self.queries = [self.queries[row] for row in rows]
+        self.responses = [self.responses[row] for row in rows]
+        self.dependencies = [self.dependencies[row] for row in rows]
+        for name in ('sq_norms', 'last_used', 'hit_counts', 'row_ids', 'created', 'chunk_id_limits', 'scope_ids'):
+            values = getattr(self, name)
+            values[:len(rows)] = values[rows]
+        self.embeddings[:len(rows)] = self.embeddings[rows]
+        self.size = len(rows)
+        metrics.set_gauge('cache_entries', self.size, cache=self.table)
+
+    def _drop(self, stale, reason):
+        logging.info(f"Invalidating {len(stale)} cached entries {reason}.")
+        metrics.inc('cache_invalidations_total', len(stale), cache=self.table)
+        self.connection.executemany(f"DELETE FROM {self.table} WHERE id = ?", [(int(self.row_ids[row]),) for row in stale])
+        stale = set(stale)
+        self._keep([row for row in range(self.size) if row not in stale])
+
+    def _recheck_older(self):
+        # I have re-checked entries written before the newest chunks existed: a newsletter that was added changes
+        # no existing entry's documents, but its chunks may now belong in an entry's results.
+        if self.recheck is None or self.chunk_id_limit is None:
+            return
+        older = np.flatnonzero(self.chunk_id_limits[:self.size] < self.chunk_id_limit)
+        if not len(older):
+            return
+        outranked = np.asarray(self.recheck(self.embeddings[older], self.chunk_id_limits[older]), dtype=bool)
+        # The others stay valid for every chunk up to the current limit, so they are not checked again.
+        kept = older[~outranked]
+        self.chunk_id_limits[kept] = self.chunk_id_limit
+        self.connection.executemany(
+            f"UPDATE {self.table} SET chunk_id_limit = ? WHERE id = ?", [(self.chunk_id_limit, int(self.row_ids[row])) for row in kept],
+        )
+        if outranked.any():
+            self._drop(older[outranked].tolist(), "that chunks of added documents now rank into")
+
+    def set_documents(self, document_hashes, corpus_version=None, chunk_id_limit=None, recheck=None):
+        """Record the current {filename: file hash} and drop entries built from documents that changed or were removed.
+
+        With chunk_id_limit and recheck, entries written before the chunks at or above their limit existed
+        are dropped if recheck finds those chunks would now rank into their results.
+        """
+        with self.lock:
+            self.document_hashes = dict(document_hashes)
+            self.corpus_version = corpus_version
+            self.chunk_id_limit = chunk_id_limit
+            self.recheck = recheck
+            self._refresh()
+            stale = [row for row in range(self.size) if not self._is_current(self.dependencies[row])]
+            if stale:
+                self._drop(stale, "built from changed documents")
+            self._recheck_older()
+            # Entries other processes wrote before any documents were tagged cannot be checked, so they go too.
+            self.connection.execute(f"DELETE FROM {self.table} WHERE model_name = ? AND documents IS NULL", (self.model_name,))
+            self.connection.execute(
+                f"DELETE FROM {self.table}_deletions WHERE deleted_at < ?", (int(time.time() - DELETIONS_RETENTION_SECONDS),),
+            )
+
+    def _expired(self):
+        if self.ttl_ns is None:
+            return np.zeros(self.size, dtype=bool)
+        return self.created[:self.size] < time.time_ns() - self.ttl_ns
+
+    def lookup(self, query_embedding, threshold=0.5, scope=''):
+        """Return the cached response nearest to query_embedding within scope if it is closer than threshold."""
+        response = self._lookup(query_embedding, threshold, scope)
+        metrics.inc('cache_requests_total', cache=self.table, result='miss' if response is None else 'hit')
+        return response
+
+    def _lookup(self, query_embedding, threshold, scope):
+        query = np.asarray(query_embedding, dtype='float32')
+        with self.lock:
+            self._refresh()
+            if self.size == 0 or scope not in self.scope_numbers:
+                return None
+            if query.shape[0] != self.embeddings.shape[1]:
+                logging.warning("Cached embedding dimension mismatch. Skipping cache lookup.")
+                return None
+
+            # I have computed all L2 distances in one matrix-vector product: |e - q|^2 = |e|^2 - 2 e.q + |q|^2.
+            sq_distances = self.sq_norms[:self.size] - 2 * (self.embeddings[:self.size] @ query) + query @ query
+            usable = (self.scope_ids[:self.size] == self.scope_numbers[scope]) & ~self._expired()
+            sq_distances = np.where(usable, sq_distances, np.inf)
+            best = int(np.argmin(sq_distances))
+            if sq_distances[best] >= threshold ** 2:
+                return None
+            # Of equally near entries the newest wins, so a replaced response is never preferred over its replacement.
+            ties = np.flatnonzero(sq_distances <= sq_distances[best] + 1e-6)
+            best = int(ties[np.argmax(self.row_ids[ties])])
+            self.last_used[best] = time.time_ns()
+            self.hit_counts[best] += 1
+            self.connection.execute(
+                f"UPDATE {self.table} SET last_used = ?, hit_count = hit_count + 1 WHERE id = ?",
+                (int(self.last_used[best]), int(self.row_ids[best])),
+            )
+            return self.responses[best]
+
+    def _victim(self):
+        # Expired entries can never be served again, so the oldest of them goes first whatever the policy.
+        expired = self._expired()
+        if expired.any():
+            candidates = np.flatnonzero(expired)
+            return int(candidates[np.argmin(self.created[candidates])])
+        if self.eviction_policy == 'lfu':
+            # Ties on hit count fall back to recency, so a stale entry goes before a fresh one.
+            return int(np.lexsort((self.last_used[:self.size], self.hit_counts[:self.size]))[0])
+        return int(np.argmin(self.last_used[:self.size]))
+
+    def _discard_near(self, embedding, threshold, scope):
+        if self.size == 0 or scope not in self.scope_numbers or embedding.shape[0] != self.embeddings.shape[1]:
+            return
+        sq_distances = self.sq_norms[:self.size] - 2 * (self.embeddings[:self.size] @ embedding) + embedding @ embedding
+        near = np.flatnonzero((self.scope_ids[:self.size] == self.scope_numbers[scope]) & (sq_distances < threshold ** 2))
+        if len(near):
+            self._drop(near.tolist(), "replaced by a newer response")
+
+    def add(self, query, query_embedding, response, scope='', documents=(), corpus_version=None, replace_threshold=None):
+        """Store response for query, tagged with the source documents (filenames) it was built from.
+
+        A response built from a corpus_version other than the current one is not stored: its documents
+        may differ from the current ones it would be tagged with. With replace_threshold, entries of the same scope
+        closer than that to query_embedding are dropped first, so lookups return the new response.
+        """
+        embedding = np.asarray(query_embedding, dtype='float32')
+        with self.lock:
+            if corpus_version is not None and corpus_version != self.corpus_version:
+                return
+            if replace_threshold is not None:
+                self._refresh()
+                self._discard_near(embedding, replace_threshold, scope)
+            now = time.time_ns()
+            # A document whose hash is not known yet is tagged None, so the entry is dropped once the hashes are known.
+            known = self.document_hashes or {}
+            dependencies = {filename: known.get(filename) for filename in sorted(set(documents))}
+            # Embeddings are stored as raw float32 bytes, which is compact and needs no parsing on load.
+            self.connection.execute(
+                f"INSERT INTO {self.table} "
+                "(model_name, query, embedding, response, last_used, scope, created_at, documents, corpus_version, chunk_id_limit) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.model_name, query, embedding.tobytes(), json.dumps(response), now, scope, now,
+                 json.dumps(dependencies), self.corpus_version, self.chunk_id_limit),
+            )
+            # I have read the new row back with everything other processes wrote before it, rather than taking its id
+            # as the last one seen: a row another process committed just before this insert has a lower id.
+            self._refresh()
+
+    def load(self):
+        # I have loaded the cache from disk to persist it across sessions.
+        # This improves the system's efficiency over time.
+        with self.lock:
+            # I have reset the cache if the embedding model changes to ensure consistency.
+            stale = self.connection.execute(f"DELETE FROM {self.table} WHERE model_name != ?", (self.model_name,)).rowcount
+            if stale:
+                logging.info("Embedding model changed. Resetting cache.")
+            # Rows deleted before this point are simply not loaded.
+            self.last_deletion = self.connection.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {self.table}_deletions").fetchone()[0]
+            self._refresh()
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+
+import numpy as np
+
+from newsletter_ai import metrics
+from newsletter_ai.llm_client import TIMEOUT_SECONDS
+
+# I have coalesced concurrent queries that would share one answer cache entry. When a newsletter lands, many sessions
+# ask the same question within seconds, and all of them miss the answer cache until the first answer is stored.
+# The first query becomes the leader and runs retrieval and generation; every query for the same model and corpus
+# version whose embedding lies within the answer cache threshold of it follows: it waits for the leader's sources
+# and streams the leader's answer pieces as they arrive, without a Gemini call of its own.
+# A streamed answer is generated on its own thread, so it completes and is cached even if the session that asked
+# first never reads it, e.g. after a Streamlit rerun.
+
+class Flight:
+    """One in-progress retrieval and generation, shared by its leader and any followers."""
+
+    def __init__(self, key, query_embedding):
+        self.key = key
+        self.query_embedding = query_embedding
+        self.started = time.monotonic()
+        self.condition = threading.Condition()
+        self.sources = None
+        self.pieces = []
+        self.done = False
+        self.error = None
+        self.followers = 0
+
+    def set_sources(self, sources):
+        with self.condition:
+            self.sources = sources
+            self.condition.notify_all()
+
+    def publish(self, piece):
+        with self.condition:
+            self.pieces.append(piece)
+            self.condition.notify_all()
+
+    def _wait(self, ready, deadline):
+        # Called with the condition held. The deadline is the waiting query's own.
+        while not ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Deadline exceeded while waiting for an identical query in flight.")
+            self.condition.wait(remaining)
+
+    def wait_for_sources(self, deadline=None):
+        with self.condition:
+            self._wait(lambda: self.sources is not None or self.error is not None, deadline or time.monotonic() + TIMEOUT_SECONDS)
+            if self.sources is None:
+                raise self.error
+            return self.sources
+
+    def follow(self, deadline=None):
+        """Yield the answer pieces as they arrive, until the flight is finished or deadline passes."""
+        deadline = deadline or time.monotonic() + TIMEOUT_SECONDS
+        position = 0
+        while True:
+            with self.condition:
+                self._wait(lambda: len(self.pieces) > position or self.done, deadline)
+                pieces = self.pieces[position:]
+                finished, error = self.done, self.error
+            yield from pieces
+            position += len(pieces)
+            if finished and position == len(self.pieces):
+                if error is not None:
+                    raise error
+                return
+
+class SingleFlight:
+    """Registry of the flights in progress in this process, keyed by model scope and corpus version."""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def join(self, key, query_embedding):
+        """Return (flight, is_leader): an equivalent flight already in progress, or a new one led by the caller."""
+        query_embedding = np.asarray(query_embedding, dtype='float32')
+        with self.lock:
+            now = time.monotonic()
+            # A flight older than an LLM call may take has a stuck leader; new queries no longer wait for it.
+            flights = [flight for flight in self.flights.get(key, []) if now - flight.started <= TIMEOUT_SECONDS]
+            self.flights[key] = flights
+            for flight in flights:
+                if np.sum((flight.query_embedding - query_embedding) ** 2) < self.threshold ** 2:
+                    flight.followers += 1
+                    metrics.inc('coalesced_queries_total')
+                    return flight, False
+            flight = Flight(key, query_embedding)
+            flights.append(flight)
+            return flight, True
+
+    def finish(self, flight, error=None):
+        """End a flight: followers get the remaining pieces, then error if there is one; new queries start their own."""
+        with self.lock:
+            flights = self.flights.get(flight.key, [])
+            if flight in flights:
+                flights.remove(flight)
+            if not flights:
+                self.flights.pop(flight.key, None)
+        with flight.condition:
+            flight.done = True
+            flight.error = error
+            flight.condition.notify_all()
+
+    def lead(self, flight, pieces, deadline=None):
+        """Generate pieces into the flight on a worker thread and return the leader's iterator over them."""
+        def run():
+            try:
+                for piece in pieces:
+                    flight.publish(piece)
+            except Exception as e:
+                self.finish(flight, e)
+                return
+            self.finish(flight)
+            if flight.followers:
+                logging.info(f"Shared one answer with {flight.followers} identical queries in flight.")
+
+        threading.Thread(target=run, name="newsletter-ai-answer-stream", daemon=True).start()
+        return flight.follow(deadline)
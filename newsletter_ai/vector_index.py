@@ -0,0 +1,235 @@
+import glob
+import hashlib
+import logging
+import os
+
+import faiss
+import numpy as np
+
+# I have saved indexes in FAISS's native format, one file per corpus version and build settings,
+# e.g. faiss_index_<corpus version>_<settings>.index.
+# The version in the file name ties each index to the exact input files it was built from.
+INDEX_DIRECTORY = '.'
+INDEX_PREFIX = 'faiss_index_'
+INDEX_SUFFIX = '.index'
+
+# The previous version is kept so processes still serving it are not left without a file during a rollout.
+KEEP_INDEX_VERSIONS = 2
+
+# Below this many chunks an exact FlatL2 search is both fast enough and more precise than anything else.
+FLAT_INDEX_LIMIT = 100
+
+# I have made the index type configurable. 'auto' picks by corpus size and memory budget:
+# flat for small corpora, then IVFFlat, IVF with 8-bit scalar quantization and finally IVF-PQ as the vectors outgrow the budget.
+# 'hnsw', 'sq8' and 'sq_fp16' can be chosen explicitly; HNSW gives the best recall per query but cannot delete vectors,
+# so it is rebuilt (from the embedding cache) whenever documents are removed or replaced.
+INDEX_TYPE = os.environ.get("FAISS_INDEX_TYPE", "auto").lower()
+MEMORY_BUDGET_MB = float(os.environ.get("FAISS_MEMORY_BUDGET_MB", 1024))
+NPROBE = int(os.environ.get("FAISS_NPROBE", 8))
+EF_SEARCH = int(os.environ.get("FAISS_EF_SEARCH", 64))
+HNSW_M = int(os.environ.get("FAISS_HNSW_M", 32))
+PQ_BYTES_PER_VECTOR = int(os.environ.get("FAISS_PQ_BYTES", 0))
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'ivf_sq8', 'ivf_pq', 'hnsw', 'sq8', 'sq_fp16')
+
+# IVF-PQ needs enough vectors to train its 256-entry codebooks; below this it falls back to IVF-SQ8.
+PQ_MIN_TRAINING_POINTS = 256 * 39
+
+def index_settings_key():
+    # Saved index files are named after these build settings too, so changing them never serves a stale index.
+    settings = f"{INDEX_TYPE}:{MEMORY_BUDGET_MB}:{HNSW_M}:{PQ_BYTES_PER_VECTOR}"
+    return hashlib.md5(settings.encode('utf-8')).hexdigest()[:8]
+
+def pq_bytes_per_vector(dimension):
+    # I have used the largest sub-quantizer count up to d/8 that divides the dimension, i.e. 96 bytes for 768-d vectors.
+    target = PQ_BYTES_PER_VECTOR or max(dimension // 8, 1)
+    return max(m for m in range(1, target + 1) if dimension % m == 0)
+
+def bytes_per_vector(index_type, dimension):
+    return {
+        'flat': 4 * dimension,
+        'ivf_flat': 4 * dimension,
+        'hnsw': 4 * dimension + 8 * HNSW_M,
+        'sq_fp16': 2 * dimension,
+        'sq8': dimension,
+        'ivf_sq8': dimension,
+        'ivf_pq': pq_bytes_per_vector(dimension),
+    }[index_type]
+
+def choose_index_type(num_chunks, dimension):
+    if INDEX_TYPE not in ('auto', *INDEX_TYPES):
+        raise ValueError(f"Unknown FAISS index type: {INDEX_TYPE}")
+    if num_chunks < FLAT_INDEX_LIMIT:
+        return 'flat'
+    if INDEX_TYPE != 'auto':
+        index_type = INDEX_TYPE
+    else:
+        budget = MEMORY_BUDGET_MB * 1024 * 1024
+        fitting = [candidate for candidate in ('ivf_flat', 'ivf_sq8') if num_chunks * bytes_per_vector(candidate, dimension) <= budget]
+        index_type = fitting[0] if fitting else 'ivf_pq'
+    if index_type == 'ivf_pq' and num_chunks < PQ_MIN_TRAINING_POINTS:
+        index_type = 'ivf_sq8'
+    return index_type
+
+# An IVF index keeps the lists and centroids it was trained with; once the list count the corpus size calls for
+# is this many times larger or smaller, the index is retrained rather than updated in place.
+IVF_RETRAIN_RATIO = 2
+
+def ivf_list_count(num_chunks):
+    return max(min(int(np.sqrt(num_chunks)), 100), 1)
+
+def needs_retraining(index, num_chunks):
+    # sqrt(n) lists trained on about n points, so a drifting list count also means the corpus has grown or shrunk
+    # well past the size the centroids were trained on.
+    if not isinstance(index, faiss.IndexIVF):
+        return False
+    wanted = ivf_list_count(num_chunks)
+    return max(index.nlist, wanted) >= IVF_RETRAIN_RATIO * min(index.nlist, wanted)
+
+def factory_string(index_type, num_chunks, dimension):
+    n_clusters = ivf_list_count(num_chunks)
+    return {
+        'flat': "IDMap2,Flat",
+        'hnsw': f"IDMap2,HNSW{HNSW_M},Flat",
+        'sq8': "IDMap2,SQ8",
+        'sq_fp16': "IDMap2,SQfp16",
+        'ivf_flat': f"IVF{n_clusters},Flat",
+        'ivf_sq8': f"IVF{n_clusters},SQ8",
+        'ivf_pq': f"IVF{n_clusters},PQ{pq_bytes_per_vector(dimension)}",
+    }[index_type]
+
+def index_type_of(index):
+    """Return the INDEX_TYPES name of an index built by build_index."""
+    if isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            return 'hnsw'
+        if isinstance(inner, faiss.IndexScalarQuantizer):
+            return 'sq_fp16' if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else 'sq8'
+        return 'flat'
+    if isinstance(index, faiss.IndexIVFPQ):
+        return 'ivf_pq'
+    if isinstance(index, faiss.IndexIVFScalarQuantizer):
+        return 'ivf_sq8'
+    return 'ivf_flat'
+
+def configure_search(index):
+    # I have applied the search-time settings on every load: nprobe for IVF lists and efSearch for the HNSW graph.
+    # IVF with the default single probe misses neighbours that sit just across a cluster boundary.
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(NPROBE, index.nlist)
+    elif isinstance(index, faiss.IndexIDMap):
+        inner = faiss.downcast_index(index.index)
+        if isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = EF_SEARCH
+    return index
+
+def build_index(embeddings, ids):
+    # I have dynamically chosen the index type based on the dataset size and memory budget.
+    # Every variant stores the manifest chunk ids, so search results map straight back to chunks.
+    num_chunks, dimension = embeddings.shape
+    index_type = choose_index_type(num_chunks, dimension)
+    description = factory_string(index_type, num_chunks, dimension)
+    logging.info(f"Using {index_type} index ({description}) for {num_chunks} chunks")
+    index = faiss.index_factory(dimension, description)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add_with_ids(embeddings, ids)
+    return configure_search(index)
+
+def indexed_ids(index):
+    """Return the ids of all vectors stored in an index built by build_index."""
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        ids = [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(index.nlist)
+            if invlists.list_size(list_no) > 0
+        ]
+        return np.concatenate(ids) if ids else np.array([], dtype='int64')
+    return faiss.vector_to_array(index.id_map)
+
+def encode_chunks(all_chunks, chunk_ids, encode):
+    embeddings = encode([all_chunks[chunk_id] for chunk_id in chunk_ids])
+    return np.asarray(embeddings, dtype='float32'), np.asarray(chunk_ids, dtype='int64')
+
+def sync_index(index, all_chunks, encode):
+    """Update an index in place so it holds exactly the chunks in all_chunks.
+
+    Returns the (possibly rebuilt) index and whether anything changed.
+    """
+    wanted = set(all_chunks)
+
+    present = set(indexed_ids(index).tolist()) if index is not None else set()
+    removed = sorted(present - wanted)
+    added = sorted(wanted - present)
+
+    # I have rebuilt from scratch only when there is no index yet, the corpus has outgrown the current index type
+    # or the IVF lists it was trained with, or vectors must be deleted from an HNSW graph, which does not support removal.
+    if (
+        index is None
+        or index_type_of(index) != choose_index_type(len(wanted), index.d)
+        or needs_retraining(index, len(wanted))
+        or (removed and index_type_of(index) == 'hnsw')
+    ):
+        chunk_ids = sorted(wanted)
+        logging.info(f"Building FAISS index over {len(chunk_ids)} chunks.")
+        return build_index(*encode_chunks(all_chunks, chunk_ids, encode)), True
+
+    # Vectors of removed or replaced documents are deleted by id, and only new chunks are encoded.
+    if removed:
+        index.remove_ids(np.asarray(removed, dtype='int64'))
+    if added:
+        embeddings, ids = encode_chunks(all_chunks, added, encode)
+        index.add_with_ids(embeddings, ids)
+    if removed or added:
+        logging.info(f"FAISS index updated: {len(added)} chunk(s) added, {len(removed)} removed.")
+    return index, bool(removed or added)
+
+def index_path(version, index_directory=INDEX_DIRECTORY):
+    return os.path.join(index_directory, f"{INDEX_PREFIX}{version}_{index_settings_key()}{INDEX_SUFFIX}")
+
+def saved_index_files(index_directory=INDEX_DIRECTORY):
+    """Return saved index files, newest first."""
+    paths = glob.glob(os.path.join(index_directory, f"{INDEX_PREFIX}*{INDEX_SUFFIX}"))
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+def load_index_mmap(index_file):
+    # I have opened saved indexes memory-mapped and read-only, so every process on the host shares one copy
+    # through the OS page cache instead of holding its own in the heap.
+    # Flat codes are mapped with IO_FLAG_MMAP_IFC; IVF inverted lists only support IO_FLAG_MMAP on its own.
+    mmap_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    try:
+        index = faiss.read_index(index_file, mmap_flags | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0))
+    except RuntimeError:
+        index = faiss.read_index(index_file, mmap_flags)
+    return configure_search(index)
+
+def save_index(index, index_file):
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    faiss.write_index(index, tmp_file)
+    os.replace(tmp_file, index_file)
+
+def remove_old_indexes(index_directory=INDEX_DIRECTORY, keep=KEEP_INDEX_VERSIONS):
+    # Processes that still have an old version mapped keep reading it; the file is only unlinked.
+    for index_file in saved_index_files(index_directory)[keep:]:
+        try:
+            os.remove(index_file)
+        except FileNotFoundError:
+            pass
+
+def load_or_update_index(all_chunks, encode, version, index_directory=INDEX_DIRECTORY):
+    """Return a read-only index for this corpus version, building it from the newest saved index if needed."""
+    index_file = index_path(version, index_directory)
+    if os.path.exists(index_file):
+        print("Loaded existing FAISS index.")
+        return load_index_mmap(index_file)
+
+    # I have started from the newest saved version, so only the chunks that changed since then are encoded.
+    previous_files = saved_index_files(index_directory)
+    previous = faiss.read_index(previous_files[0]) if previous_files else None
+    index, _ = sync_index(previous, all_chunks, encode)
+    save_index(index, index_file)
+    remove_old_indexes(index_directory)
+    print("Created and saved new FAISS index.")
+    return load_index_mmap(index_file)
@@ -0,0 +1,82 @@
+import logging
+import os
+import threading
+
+from newsletter_ai import ingestion
+
+# I have added an optional watcher on the input directory (INPUT_WATCHER=true). It keeps the current files hash
+# up to date from file system events (inotify on Linux, via watchdog) and reports every change as it happens,
+# so queries read the hash from memory instead of scanning the directory, and a rebuild starts before anyone asks.
+# Without watchdog it falls back to a stat scan every INPUT_POLL_SECONDS on its own thread, still off the query path.
+WATCH_INPUT_FILES = os.environ.get("INPUT_WATCHER", "false").lower() == "true"
+# Copying a PDF in produces a burst of events; the directory is rescanned once they have settled.
+DEBOUNCE_SECONDS = float(os.environ.get("INPUT_WATCH_DEBOUNCE_SECONDS", 1.0))
+POLL_SECONDS = float(os.environ.get("INPUT_POLL_SECONDS", 5.0))
+
+class InputWatcher:
+    """Tracks the files hash of a directory and calls on_change(files_hash) whenever it changes."""
+
+    def __init__(self, directory, on_change, debounce=DEBOUNCE_SECONDS, poll_interval=POLL_SECONDS):
+        self.directory = directory
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.files_hash = ingestion.get_files_hash(directory)
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+        self.observer = None
+
+    def start(self):
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+        except ImportError:
+            logging.info(f"watchdog is not installed; polling {self.directory} every {self.poll_interval:.0f}s instead.")
+        else:
+            watcher = self
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    paths = [event.src_path, getattr(event, 'dest_path', '')]
+                    if any(str(path).endswith('.pdf') for path in paths):
+                        watcher.changed.set()
+
+            self.observer = Observer()
+            self.observer.daemon = True
+            self.observer.schedule(Handler(), self.directory, recursive=False)
+            self.observer.start()
+        threading.Thread(target=self._run, name="newsletter-ai-input-watcher", daemon=True).start()
+        return self
+
+    def _run(self):
+        while not self.stopped.is_set():
+            if self.observer is not None:
+                self.changed.wait()
+                # Wait until the burst of events is over before rescanning.
+                while self.changed.is_set() and not self.stopped.is_set():
+                    self.changed.clear()
+                    self.stopped.wait(self.debounce)
+            else:
+                self.stopped.wait(self.poll_interval)
+            if self.stopped.is_set():
+                return
+            self.check()
+
+    def check(self):
+        """Rescan the directory and report a changed files hash."""
+        try:
+            files_hash = ingestion.get_files_hash(self.directory)
+        except OSError:
+            # A file vanished mid-scan; the event for it triggers another scan.
+            logging.exception(f"Could not scan {self.directory}.")
+            return
+        if files_hash != self.files_hash:
+            self.files_hash = files_hash
+            logging.info(f"Input files changed; new files hash {files_hash}.")
+            self.on_change(files_hash)
+
+    def stop(self):
+        self.stopped.set()
+        self.changed.set()
+        if self.observer is not None:
+            self.observer.stop()
@@ -0,0 +1,83 @@
+# Script Purpose - Import-time and cold start profile
+# This script measures how long the chatbot's imports and heavy resources take to load,
+# so cold start regressions can be compared between releases.
+# To execute, run the script manually with `python3 profile_imports.py`
+# Add `--loaders` to also time the lazy loaders (this loads the models and may download weights).
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+# Modules the chatbot page imports while rendering; these decide how quickly the first byte appears.
+PAGE_IMPORTS = ['streamlit', 'dotenv', 'newsletter_ai.resources', 'newsletter_ai.curated_answers', 'newsletter_ai.rag']
+
+# Modules that are imported lazily, behind the loaders in newsletter_ai.resources.
+LAZY_IMPORTS = ['pypdf', 'langchain.text_splitter', 'faiss', 'sentence_transformers', 'vertexai.generative_models']
+
+LOADERS = ['get_encoder', 'get_query_cache', 'get_answer_cache', 'get_embedding_store', 'load_models']
+
+def profile_import(modules):
+    # Each measurement runs in a fresh interpreter, so modules imported by an earlier step do not hide their cost.
+    statement = '; '.join(f"import {module}" for module in modules)
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], capture_output=True, text=True)
+    wall_seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        return {"modules": modules, "error": result.stderr.strip().splitlines()[-1]}
+
+    # -X importtime prints "import time: self [us] | cumulative | imported package"; top-level imports have no indent.
+    top_level = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, package = line[len('import time:'):].split('|')
+        if not package.startswith('  '):
+            top_level[package.strip()] = int(cumulative) / 1e6
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:15]
+    return {
+        "modules": modules,
+        "wall_seconds": round(wall_seconds, 3),
+        "import_seconds": round(sum(top_level.values()), 3),
+        "slowest": [{"module": module, "seconds": round(seconds, 3)} for module, seconds in slowest],
+    }
+
+def profile_loaders():
+    from newsletter_ai import resources
+    timings = {}
+    for loader in LOADERS:
+        started = time.perf_counter()
+        getattr(resources, loader)()
+        timings[loader] = round(time.perf_counter() - started, 3)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile NewsLetter.AI imports and cold start.")
+    parser.add_argument('--output', default='import_profile.json', help="Where to write the JSON report.")
+    parser.add_argument('--loaders', action='store_true', help="Also time the lazy resource loaders.")
+    args = parser.parse_args()
+
+    report = {
+        "python": platform.python_version(),
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "page": profile_import(PAGE_IMPORTS),
+        "lazy": [profile_import([module]) for module in LAZY_IMPORTS],
+    }
+    if args.loaders:
+        report["loaders"] = profile_loaders()
+
+    for entry in [report["page"], *report["lazy"]]:
+        timing = entry.get("error") or f"{entry['import_seconds']:.3f}s import, {entry['wall_seconds']:.3f}s wall"
+        print(f"{', '.join(entry['modules'])}: {timing}")
+    for loader, seconds in report.get("loaders", {}).items():
+        print(f"{loader}: {seconds:.3f}s")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {os.path.abspath(args.output)}")
+
+if __name__ == "__main__":
+    main()